@@ -3,17 +3,29 @@
 Route module for the API
 """
 from os import getenv
+from api.v1.auth.auth import ExcludedPaths
+from api.v1.metrics import METRICS
+from api.v1.profiler import profiler_middleware
 from api.v1.views import app_views
 from flask import Flask, jsonify, abort, request
 from flask_cors import (CORS, cross_origin)
 import os
+import time
 
 
 app = Flask(__name__)
 app.register_blueprint(app_views)
+app.wsgi_app = profiler_middleware(app.wsgi_app)
 CORS(app, resources={r"/api/v1/*": {"origins": "*"}})
 auth = None
 
+# paths exempted from authentication, compiled once
+EXCLUDED_PATHS = ExcludedPaths([
+    '/api/v1/status/',
+    '/api/v1/unauthorized/',
+    '/api/v1/forbidden/',
+    '/api/v1/metrics/'])
+
 auth_type = getenv("AUTH_TYPE", None)
 
 if auth_type == 'auth':
@@ -25,25 +37,66 @@ if auth_type == 'basic_auth':
     auth = BasicAuth()
 
 
+def auth_metrics() -> list:
+    """ Counters of the credential cache, with Basic authentication
+    """
+    credential_cache = getattr(auth, 'credential_cache', None)
+    if credential_cache is None:
+        return []
+    stats = credential_cache.stats()
+    return [
+        ('credential_cache_lookups_total', 'counter',
+         "Lookups of the credential cache",
+         {('hit',): stats['hits'], ('miss',): stats['misses']},
+         ('result',)),
+        ('credential_cache_size', 'gauge',
+         "Entries of the credential cache", {(): stats['size']}, ()),
+    ]
+
+
+METRICS.add_collector(auth_metrics)
+
+
+@app.before_request
+def start_timer():
+    """ Records the start of the request, for its duration metric
+    """
+    request.start_time = time.perf_counter()
+
+
 @app.before_request
 def authentication_check():
     """ authentication handler before every request.
     """
 
     if auth is not None:
-        excl_paths = [
-            '/api/v1/status/',
-            '/api/v1/unauthorized/',
-            '/api/v1/forbidden/']
-
         # excluded paths are ignored from authentication
-        if auth.require_auth(request.path, excl_paths) is True:
+        with METRICS.time('auth_phase_duration_seconds', 'require_auth'):
+            needs_auth = auth.require_auth(request.path, EXCLUDED_PATHS)
+        if needs_auth is True:
             if auth.authorization_header(request) is None:
                 abort(401)
-            if auth.current_user(request) is None:
+            with METRICS.time('auth_phase_duration_seconds', 'current_user'):
+                user = auth.current_user(request)
+            if user is None:
                 abort(403)
 
 
+@app.after_request
+def record_request(response):
+    """ Records the duration of the request, per route and status
+    """
+    start_time = getattr(request, 'start_time', None)
+    if start_time is not None:
+        rule = request.url_rule
+        METRICS.observe('http_request_duration_seconds',
+                        (request.method,
+                         rule.rule if rule is not None else 'unmatched',
+                         str(response.status_code)),
+                        time.perf_counter() - start_time)
+    return response
+
+
 @app.errorhandler(401)
 def unauthorised(error) -> str:
     """ unauthorised error handler
@@ -2,22 +2,79 @@
 """
 App's Authentication system
 """
-from typing import TypeVar, List
+from functools import lru_cache
+from typing import TypeVar, List, Iterable, Union
 from flask import request as req
 
 
+class ExcludedPaths:
+    """ Compiled list of paths exempted from authentication.
+
+    Paths are slash tolerant. A path ending by `*` is a wildcard matching
+    every path starting with what precedes it (`/api/v1/stat*` matches
+    `/api/v1/status` and `/api/v1/stats`).
+    Exact paths are kept in a set and wildcard prefixes in a tuple, so
+    a match does not walk the whole list.
+    """
+
+    def __init__(self, paths: Iterable[str]):
+        """ Compiles the excluded paths.
+        """
+        exact = set()
+        prefixes = []
+        for excl_path in paths:
+            if not excl_path:
+                continue
+            if excl_path[-1] == '*':
+                prefixes.append(excl_path[:-1])
+            elif excl_path[-1] == '/':
+                exact.add(excl_path)
+            else:
+                exact.add(excl_path + '/')
+        self.exact = frozenset(exact)
+        self.prefixes = tuple(prefixes)
+
+    def __bool__(self) -> bool:
+        """ False when there is no excluded path.
+        """
+        return bool(self.exact) or bool(self.prefixes)
+
+    def match(self, path: str) -> bool:
+        """ Determines if an url path is excluded.
+        """
+        if path[-1] == '/':
+            slashed_path = path
+        else:
+            slashed_path = path + '/'
+
+        if slashed_path in self.exact:
+            return True
+
+        return bool(self.prefixes) and slashed_path.startswith(self.prefixes)
+
+
+@lru_cache(maxsize=32)
+def _compile_excluded_paths(paths: tuple) -> ExcludedPaths:
+    """ Compiles, once, an excluded paths list given to `require_auth`.
+    """
+    return ExcludedPaths(paths)
+
+
 class Auth:
     """ Implementation of a Basic Authentication system
     """
 
-    def require_auth(self, path: str, excluded_paths: List[str]) -> bool:
+    def require_auth(self, path: str,
+                     excluded_paths: Union[List[str], ExcludedPaths]) \
+            -> bool:
         """ Determines if an url path requires authentication.
 
         The path is exempted if it is part of the excluded_paths list.
-        Methods assumes that excluded_paths contains string paths always ending
-        by a `/`.
+        excluded_paths may also be an already compiled ExcludedPaths, which
+        avoids compiling the list on every call.
         A url path is slash tolerant.
         (/api/v1/status and /api/v1/status/) both return False.
+        An excluded path ending by `*` matches any path starting with it.
 
         Returns:
           - True, if the path needs it
@@ -26,16 +83,10 @@ class Auth:
         if not path or not excluded_paths:
             return True
 
-        # so paths can be slash tolerant
-        if path[-1] == '/':
-            slashed_path = path
-        else:
-            slashed_path = path + '/'
-
-        if slashed_path in excluded_paths:
-            return False
+        if not isinstance(excluded_paths, ExcludedPaths):
+            excluded_paths = _compile_excluded_paths(tuple(excluded_paths))
 
-        return True
+        return not excluded_paths.match(path)
 
     def authorization_header(self, request: TypeError('req') = None) -> str:
         """ Retrieves the authorization header of a request.
@@ -2,18 +2,52 @@
 """ Module of Users views
 """
 from api.v1.views import app_views
-from flask import abort, jsonify, request
+from flask import abort, jsonify, request, Response
 from models.user import User
+from urllib.parse import urlencode
+import json
 
 
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """ GET /api/v1/users
+    Query parameters:
+      - limit (optional): maximum number of users returned
+      - after (optional): only users with an ID greater than this one
+    Users are ordered by ID and the list is streamed as it is serialized.
+    With a limit, the `Link` header gives the URL of the next page.
     Return:
-      - list of all User objects JSON represented
+      - list of User objects JSON represented
+      - 400 if the limit is not a positive number
     """
-    all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users)
+    after = request.args.get('after')
+    limit = request.args.get('limit')
+    headers = {}
+    if limit is None:
+        users = User.iter_ordered(after)
+    else:
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if limit <= 0:
+            return jsonify({'error': "Wrong limit"}), 400
+        users = User.page(after, limit)
+        if len(users) == limit:
+            headers['Link'] = '<{}?{}>; rel="next"'.format(
+                request.base_url,
+                urlencode({'limit': limit, 'after': users[-1].id}))
+
+    def generate():
+        yield '['
+        for i, user in enumerate(users):
+            if i > 0:
+                yield ', '
+            yield json.dumps(user.to_json(), sort_keys=True)
+        yield ']\n'
+
+    return Response(generate(), mimetype='application/json',
+                    headers=headers)
 
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
@@ -89,6 +123,65 @@ def create_user() -> str:
     return jsonify({'error': error_msg}), 400
 
 
+@app_views.route('/users/import', methods=['POST'], strict_slashes=False)
+def import_users() -> str:
+    """ POST /api/v1/users/import
+    NDJSON body, one JSON object per line:
+      - email
+      - password
+      - last_name (optional)
+      - first_name (optional)
+    All the users are validated first, then saved with a single write.
+    Return:
+      - number of created users
+      - 400 if a line is invalid (no user is created)
+    """
+    users = []
+    for line_nb, line in enumerate(request.stream, 1):
+        if not line.strip():
+            continue
+        try:
+            rj = json.loads(line)
+        except ValueError:
+            rj = None
+        error_msg = None
+        if not isinstance(rj, dict):
+            error_msg = "Wrong format"
+        elif rj.get("email", "") == "":
+            error_msg = "email missing"
+        elif rj.get("password", "") == "":
+            error_msg = "password missing"
+        if error_msg is not None:
+            return jsonify({'error': "line {}: {}".format(line_nb,
+                                                          error_msg)}), 400
+        user = User()
+        user.email = rj.get("email")
+        user.password = rj.get("password")
+        user.first_name = rj.get("first_name")
+        user.last_name = rj.get("last_name")
+        users.append(user)
+
+    try:
+        User.save_many(users)
+    except Exception as e:
+        return jsonify({'error': "Can't create Users: {}".format(e)}), 400
+    return jsonify({'created': len(users)}), 201
+
+
+@app_views.route('/users/export', methods=['GET'], strict_slashes=False)
+def export_users() -> str:
+    """ GET /api/v1/users/export
+    Return:
+      - all User objects JSON represented, one per line (NDJSON),
+      streamed as they are serialized
+    """
+    def generate():
+        for user in User.iter_ordered():
+            yield json.dumps(user.to_json()) + '\n'
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+
 @app_views.route('/users/<user_id>', methods=['PUT'], strict_slashes=False)
 def update_user(user_id: str = None) -> str:
     """ PUT /api/v1/users/:id
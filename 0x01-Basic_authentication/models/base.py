@@ -1,20 +1,134 @@
 #!/usr/bin/env python3
 """ Base module
 """
+from bisect import bisect_left, bisect_right, insort
 from datetime import datetime
 from typing import TypeVar, List, Iterable
-from os import path
+from os import getenv, path
 import json
+import os
+import threading
 import uuid
 
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
 DATA = {}
+# secondary indexes: INDEXES[class name][attribute][value] = {id: obj}
+INDEXES = {}
+# ordered id index: ORDERED_IDS[class name] = sorted list of all the ids
+ORDERED_IDS = {}
+# number of records appended to each class journal since the last snapshot
+JOURNAL_SIZES = {}
+# lazy loading: PENDING[class name][id] = serialized object not built yet
+PENDING = {}
+_journal_lock = threading.Lock()
+_compaction_lock = threading.Lock()
+_READ_CHUNK_SIZE = 64 * 1024
+# characters that can follow a complete JSON value
+_DELIMITERS = ',:]} \t\r\n'
+# cache of the slot attribute names of each class
+_SLOT_NAMES = {}
+
+
+def journal_enabled() -> bool:
+    """ Check if the append-only journal mode is enabled.
+
+    The mode is set by the environment variable DATA_JOURNAL.
+    """
+    return getenv('DATA_JOURNAL', '').lower() in ('1', 'true', 'yes')
+
+
+def lazy_load_enabled() -> bool:
+    """ Check if objects are only built when first accessed.
+
+    The mode is set by the environment variable DATA_LAZY_LOAD.
+    """
+    return getenv('DATA_LAZY_LOAD', '').lower() in ('1', 'true', 'yes')
+
+
+def iter_json_object(f, chunk_size: int = _READ_CHUNK_SIZE):
+    """ Iterate over the members of the top level JSON object of a file.
+
+    The file is read chunk by chunk and each value is decoded as soon as
+    it is complete, so the whole document is never held in memory.
+    Yields:
+      - (key, value) tuples, in file order
+    Raises:
+      - ValueError: if the file is not a valid JSON object
+    """
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    eof = False
+
+    def _fill():
+        nonlocal buf, pos, eof
+        chunk = f.read(chunk_size)
+        if not chunk:
+            eof = True
+        buf = buf[pos:] + chunk
+        pos = 0
+
+    def _skip_ws():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos].isspace():
+                pos += 1
+            if pos < len(buf) or eof:
+                return
+            _fill()
+
+    def _expect(chars: str) -> str:
+        nonlocal pos
+        _skip_ws()
+        if pos >= len(buf) or buf[pos] not in chars:
+            raise ValueError("Expecting one of {!r}".format(chars))
+        pos += 1
+        return buf[pos - 1]
+
+    def _decode():
+        nonlocal pos
+        _skip_ws()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                if eof:
+                    raise
+                _fill()
+                continue
+            if not eof and (end == len(buf) or buf[end] not in _DELIMITERS):
+                # a number could go on in the next chunk
+                _fill()
+                continue
+            pos = end
+            return value
+
+    _expect('{')
+    _skip_ws()
+    if pos < len(buf) and buf[pos] == '}':
+        return
+    while True:
+        key = _decode()
+        _expect(':')
+        yield key, _decode()
+        if _expect(',}') == '}':
+            return
 
 
 class Base():
     """ Base class
+
+    Subclasses can list attributes in `indexed_attributes` to get a hash
+    index on them. The index only covers stored objects (the ones in DATA)
+    and is kept up to date by `save`, `remove` and attribute assignment,
+    so `search` on an indexed attribute does not scan every object.
+
+    Subclasses can also declare `__slots__` for all their attributes to
+    drop the per-instance `__dict__` and reduce memory per object.
     """
+    __slots__ = ('id', 'created_at', 'updated_at')
+    indexed_attributes = ()
 
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
@@ -35,6 +149,65 @@ class Base():
         else:
             self.updated_at = datetime.utcnow()
 
+    def __setattr__(self, name: str, value) -> None:
+        """ Set an attribute, keeping the secondary indexes up to date
+        """
+        if name not in self.__class__.indexed_attributes \
+                or not self._is_stored():
+            super().__setattr__(name, value)
+            return
+
+        self._unindex(name)
+        super().__setattr__(name, value)
+        self._index(name)
+
+    def _is_stored(self) -> bool:
+        """ Check if this very instance is the one stored in DATA
+        """
+        s_class = self.__class__.__name__
+        obj_id = getattr(self, 'id', None)
+        return DATA.get(s_class, {}).get(obj_id) is self
+
+    def _index(self, name: str) -> None:
+        """ Add the object to the index of the attribute `name`
+        """
+        s_class = self.__class__.__name__
+        index = INDEXES.setdefault(s_class, {}).setdefault(name, {})
+        value = getattr(self, name, None)
+        try:
+            index.setdefault(value, {})[self.id] = self
+        except TypeError:  # unhashable values are only found by scanning
+            pass
+
+    def _unindex(self, name: str) -> None:
+        """ Remove the object from the index of the attribute `name`
+        """
+        s_class = self.__class__.__name__
+        index = INDEXES.get(s_class, {}).get(name)
+        if index is None:
+            return
+        value = getattr(self, name, None)
+        try:
+            bucket = index.get(value)
+        except TypeError:
+            return
+        if bucket is not None and bucket.get(self.id) is self:
+            del bucket[self.id]
+            if len(bucket) == 0:
+                del index[value]
+
+    @classmethod
+    def rebuild_indexes(cls):
+        """ Rebuild all the secondary indexes of the class from DATA
+        """
+        s_class = cls.__name__
+        INDEXES[s_class] = {name: {} for name in cls.indexed_attributes}
+        for obj in DATA.get(s_class, {}).values():
+            for name in cls.indexed_attributes:
+                obj._index(name)
+        ORDERED_IDS[s_class] = sorted(list(DATA.get(s_class, {}).keys()) +
+                                      list(PENDING.get(s_class, {}).keys()))
+
     def __eq__(self, other: TypeVar('Base')) -> bool:
         """ Equality
         """
@@ -44,11 +217,42 @@ class Base():
             return False
         return (self.id == other.id)
 
+    @classmethod
+    def _slot_names(cls) -> tuple:
+        """ Names of the slot attributes of the class (and its parents)
+        """
+        names = _SLOT_NAMES.get(cls)
+        if names is None:
+            names = []
+            for klass in reversed(cls.__mro__):
+                slots = klass.__dict__.get('__slots__', ())
+                if isinstance(slots, str):
+                    slots = (slots,)
+                for name in slots:
+                    if name not in ('__dict__', '__weakref__') \
+                            and name not in names:
+                        names.append(name)
+            names = tuple(names)
+            _SLOT_NAMES[cls] = names
+        return names
+
+    def _attributes(self) -> Iterable[tuple]:
+        """ Iterate over the (name, value) of the set attributes
+
+        Slot attributes come first, then the ones of `__dict__` if any.
+        """
+        for name in self.__class__._slot_names():
+            try:
+                yield name, getattr(self, name)
+            except AttributeError:  # slot never assigned
+                continue
+        yield from getattr(self, '__dict__', {}).items()
+
     def to_json(self, for_serialization: bool = False) -> dict:
         """ Convert the object a JSON dictionary
         """
         result = {}
-        for key, value in self.__dict__.items():
+        for key, value in self._attributes():
             if not for_serialization and key[0] == '_':
                 continue
             if type(value) is datetime:
@@ -60,53 +264,237 @@ class Base():
     @classmethod
     def load_from_file(cls):
         """ Load all objects from file
+
+        The snapshot file is loaded first, then the journal records written
+        after it (if any) are replayed on top of it.
+        The snapshot is parsed incrementally. With DATA_LAZY_LOAD enabled,
+        objects are only built when first accessed.
         """
         s_class = cls.__name__
         file_path = ".db_{}.json".format(s_class)
         DATA[s_class] = {}
-        if not path.exists(file_path):
-            return
+        PENDING[s_class] = {}
+        # a background compaction must not swap the files while reading
+        with _compaction_lock:
+            lazy = lazy_load_enabled()
+            if path.exists(file_path):
+                with open(file_path, 'r') as f:
+                    for obj_id, obj_json in iter_json_object(f):
+                        if lazy:
+                            PENDING[s_class][obj_id] = obj_json
+                        else:
+                            DATA[s_class][obj_id] = cls(**obj_json)
 
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+            JOURNAL_SIZES[s_class] = 0
+            journal_path = cls._journal_path()
+            compacting_path = journal_path + '.compacting'
+            for file_path in (compacting_path, journal_path):
+                JOURNAL_SIZES[s_class] += cls._replay_journal(file_path)
+            cls.rebuild_indexes()
+
+            # leftover of an interrupted compaction: everything is in DATA now
+            if path.exists(compacting_path):
+                with _journal_lock:
+                    cls.save_to_file()
+                    for file_path in (compacting_path, journal_path):
+                        if path.exists(file_path):
+                            os.remove(file_path)
+                    JOURNAL_SIZES[s_class] = 0
 
     @classmethod
     def save_to_file(cls):
         """ Save all objects to file
         """
+        cls._write_snapshot(cls._snapshot_items())
+
+    @classmethod
+    def _snapshot_items(cls) -> list:
+        """ All the objects of the class, built or still pending
+        """
+        s_class = cls.__name__
+        return list(PENDING.get(s_class, {}).values()) + \
+            list(DATA.get(s_class, {}).values())
+
+    @classmethod
+    def _write_snapshot(cls, objs: list):
+        """ Atomically replace the snapshot file with the given objects.
+
+        Pending objects (serialized dicts) are written as they are.
+        """
         s_class = cls.__name__
         file_path = ".db_{}.json".format(s_class)
         objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
+        for obj in objs:
+            if isinstance(obj, dict):
+                objs_json[obj.get('id')] = obj
+            else:
+                objs_json[obj.id] = obj.to_json(True)
 
-        with open(file_path, 'w') as f:
+        tmp_path = file_path + '.tmp'
+        with open(tmp_path, 'w') as f:
             json.dump(objs_json, f)
+        os.replace(tmp_path, file_path)
+
+    @classmethod
+    def _journal_path(cls) -> str:
+        """ Path of the append-only journal of the class
+        """
+        return ".db_{}.journal".format(cls.__name__)
+
+    @classmethod
+    def _replay_journal(cls, file_path: str) -> int:
+        """ Apply the records of a journal file to DATA.
+
+        A truncated last line (crash during an append) is ignored.
+        Returns:
+          - the number of records replayed
+        """
+        if not path.exists(file_path):
+            return 0
+
+        s_class = cls.__name__
+        lazy = lazy_load_enabled()
+        replayed = 0
+        with open(file_path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if record.get('op') == 'save':
+                    obj_json = record.get('obj')
+                    obj_id = obj_json.get('id')
+                    if lazy:
+                        DATA[s_class].pop(obj_id, None)
+                        PENDING[s_class][obj_id] = obj_json
+                    else:
+                        DATA[s_class][obj_id] = cls(**obj_json)
+                elif record.get('op') == 'remove':
+                    DATA[s_class].pop(record.get('id'), None)
+                    PENDING[s_class].pop(record.get('id'), None)
+                replayed += 1
+        return replayed
+
+    @classmethod
+    def _append_journal(cls, *records: dict):
+        """ Append records to the journal of the class, in one write.
+
+        Once the journal holds DATA_JOURNAL_COMPACT_EVERY records (1000 by
+        default) it is compacted into the snapshot in the background.
+        """
+        s_class = cls.__name__
+        lines = ''.join(json.dumps(record) + '\n' for record in records)
+        with _journal_lock:
+            with open(cls._journal_path(), 'a') as f:
+                f.write(lines)
+            JOURNAL_SIZES[s_class] = JOURNAL_SIZES.get(s_class, 0) + \
+                len(records)
+            compact_every = int(getenv('DATA_JOURNAL_COMPACT_EVERY', 1000))
+            if JOURNAL_SIZES[s_class] < compact_every:
+                return
+        cls.compact(wait=False)
+
+    @classmethod
+    def compact(cls, wait: bool = True) -> bool:
+        """ Fold the journal into a new snapshot file.
+
+        The current journal is set aside, so new records go to a fresh one
+        while the snapshot is written. Replaying a record already contained
+        in the snapshot is harmless, which makes the switch safe.
+        Returns:
+          - False if a compaction of the class is already running
+          - True otherwise
+        """
+        s_class = cls.__name__
+        journal_path = cls._journal_path()
+        compacting_path = journal_path + '.compacting'
+        with _journal_lock:
+            if path.exists(compacting_path):
+                return False
+            if path.exists(journal_path):
+                os.replace(journal_path, compacting_path)
+            JOURNAL_SIZES[s_class] = 0
+            objs = cls._snapshot_items()
+
+        def _compact():
+            with _compaction_lock:
+                cls._write_snapshot(objs)
+                if path.exists(compacting_path):
+                    os.remove(compacting_path)
+
+        if wait:
+            _compact()
+        else:
+            threading.Thread(target=_compact, daemon=True).start()
+        return True
+
+    def _store(self):
+        """ Put the object in DATA and in the indexes, without persisting
+        """
+        s_class = self.__class__.__name__
+        was_pending = PENDING.get(s_class, {}).pop(self.id, None) is not None
+        previous = DATA[s_class].get(self.id)
+        if previous is not self:
+            if previous is not None:
+                for name in self.__class__.indexed_attributes:
+                    previous._unindex(name)
+            elif not was_pending:
+                insort(ORDERED_IDS.setdefault(s_class, []), self.id)
+            DATA[s_class][self.id] = self
+            for name in self.__class__.indexed_attributes:
+                self._index(name)
 
     def save(self):
         """ Save current object
         """
-        s_class = self.__class__.__name__
         self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        self._store()
+        if journal_enabled():
+            self.__class__._append_journal({'op': 'save',
+                                            'obj': self.to_json(True)})
+        else:
+            self.__class__.save_to_file()
+
+    @classmethod
+    def save_many(cls, objs: List[TypeVar('Base')]):
+        """ Save several objects with a single write to file
+        """
+        now = datetime.utcnow()
+        for obj in objs:
+            obj.updated_at = now
+            obj._store()
+        if journal_enabled():
+            cls._append_journal(*({'op': 'save', 'obj': obj.to_json(True)}
+                                  for obj in objs))
+        else:
+            cls.save_to_file()
 
     def remove(self):
         """ Remove object
         """
         s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
+        self.__class__._materialize(self.id)
+        stored = DATA[s_class].get(self.id)
+        if stored is not None:
+            for name in self.__class__.indexed_attributes:
+                stored._unindex(name)
             del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+            ids = ORDERED_IDS.get(s_class, [])
+            i = bisect_left(ids, self.id)
+            if i < len(ids) and ids[i] == self.id:
+                del ids[i]
+            if journal_enabled():
+                self.__class__._append_journal({'op': 'remove',
+                                                'id': self.id})
+            else:
+                self.__class__.save_to_file()
 
     @classmethod
     def count(cls) -> int:
         """ Count all objects
         """
         s_class = cls.__name__
-        return len(DATA[s_class].keys())
+        return len(DATA[s_class].keys()) + len(PENDING.get(s_class, {}))
 
     @classmethod
     def all(cls) -> Iterable[TypeVar('Base')]:
@@ -114,16 +502,79 @@ class Base():
         """
         return cls.search()
 
+    @classmethod
+    def iter_ordered(cls, after: str = None) -> Iterable[TypeVar('Base')]:
+        """ Iterate over all objects, ordered by ID
+
+        Only the objects with an ID greater than `after` are returned, if
+        given. The ID index is walked by small chunks, so objects saved or
+        removed during the iteration do not break it.
+        """
+        ids = ORDERED_IDS.get(cls.__name__, [])
+        last = after
+        while True:
+            start = 0 if last is None else bisect_right(ids, last)
+            chunk = ids[start:start + 256]
+            if len(chunk) == 0:
+                return
+            for obj_id in chunk:
+                obj = cls.get(obj_id)
+                if obj is not None:
+                    yield obj
+            last = chunk[-1]
+
+    @classmethod
+    def page(cls, after: str = None, limit: int = 100) \
+            -> List[TypeVar('Base')]:
+        """ Return at most `limit` objects with an ID greater than `after`
+        """
+        page = []
+        if limit <= 0:
+            return page
+        for obj in cls.iter_ordered(after):
+            page.append(obj)
+            if len(page) >= limit:
+                break
+        return page
+
     @classmethod
     def get(cls, id: str) -> TypeVar('Base'):
         """ Return one object by ID
         """
         s_class = cls.__name__
+        cls._materialize(id)
         return DATA[s_class].get(id)
 
+    @classmethod
+    def _materialize(cls, id: str = None):
+        """ Build pending objects and store them in DATA.
+
+        Only the object `id` is built if given, every pending one otherwise.
+        """
+        s_class = cls.__name__
+        pending = PENDING.get(s_class)
+        if not pending:
+            return
+
+        if id is None:
+            obj_ids = list(pending.keys())
+        else:
+            try:
+                obj_ids = [id] if id in pending else []
+            except TypeError:  # unhashable id
+                obj_ids = []
+        for obj_id in obj_ids:
+            obj = cls(**pending.pop(obj_id))
+            DATA[s_class][obj_id] = obj
+            for name in cls.indexed_attributes:
+                obj._index(name)
+
     @classmethod
     def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
         """ Search all objects with matching attributes
+
+        When one of the attributes is indexed, only the objects of the
+        matching index bucket are checked.
         """
         s_class = cls.__name__
 
@@ -135,4 +586,16 @@ class Base():
                     return False
             return True
 
-        return list(filter(_search, DATA[s_class].values()))
+        cls._materialize()
+        candidates = DATA[s_class].values()
+        indexes = INDEXES.get(s_class, {})
+        for k, v in attributes.items():
+            if k not in indexes:
+                continue
+            try:
+                candidates = indexes[k].get(v, {}).values()
+            except TypeError:  # unhashable value, fall back to a scan
+                continue
+            break
+
+        return list(filter(_search, candidates))
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+""" Password hashers module
+
+Stored hashes carry the name of their hasher and its parameters:
+  - sha256 (legacy): the 64 hex characters of an unsalted SHA-256, kept in
+    memory as the 32 bytes of the digest
+  - scrypt: `scrypt$n=<n>,r=<r>,p=<p>$<salt hex>$<hash hex>`
+  - bcrypt: `bcrypt$<bcrypt hash>` (the cost is part of the bcrypt hash)
+
+New passwords are hashed with the hasher named by PASSWORD_HASHER
+(`sha256` by default). A hash made by a weaker hasher, or by the same
+hasher with other parameters, is upgraded when the password is next
+verified. Hashes are never moved to a weaker hasher.
+
+Calibration of the cost for the current host:
+    python3 -m models.hashers scrypt --target-ms 100
+"""
+from os import getenv
+import argparse
+import hashlib
+import hmac
+import os
+import time
+
+try:
+    import bcrypt
+except ImportError:  # bcrypt is optional
+    bcrypt = None
+
+
+HASHERS = {}
+
+
+def register_hasher(hasher: 'Hasher') -> 'Hasher':
+    """ Register a hasher under its name
+    """
+    HASHERS[hasher.name] = hasher
+    return hasher
+
+
+def get_hasher(name: str = None) -> 'Hasher':
+    """ Return the hasher named `name`, or the one of PASSWORD_HASHER
+    """
+    if name is None:
+        name = getenv('PASSWORD_HASHER', 'sha256')
+    hasher = HASHERS.get(name)
+    if hasher is None:
+        raise ValueError("Unknown password hasher: {}".format(name))
+    return hasher
+
+
+def identify_hasher(encoded) -> 'Hasher':
+    """ Return the hasher of a hash, None if it is not recognized
+    """
+    if isinstance(encoded, bytes):
+        return HASHERS.get('sha256')
+    if not encoded or not isinstance(encoded, str):
+        return None
+    name = encoded.split('$', 1)[0] if '$' in encoded else 'sha256'
+    return HASHERS.get(name)
+
+
+def needs_rehash(encoded) -> bool:
+    """ Check if a verified hash should be replaced by a hash of the
+    current hasher: when it is weaker, or the same with other parameters
+    """
+    hasher = identify_hasher(encoded)
+    current = get_hasher()
+    if hasher is None or hasher.strength < current.strength:
+        return True
+    return hasher is current and current.needs_update(encoded)
+
+
+def load_hash(stored: str):
+    """ Convert a hash read from file to its in-memory form
+    """
+    hasher = identify_hasher(stored)
+    return stored if hasher is None else hasher.load(stored)
+
+
+def dump_hash(encoded) -> str:
+    """ Convert an in-memory hash to the form written to file
+    """
+    hasher = identify_hasher(encoded)
+    return encoded if hasher is None else hasher.dump(encoded)
+
+
+class Hasher():
+    """ Base of the password hashers
+
+    `strength` orders the hashers: a hash is only rehashed with a
+    stronger hasher, never a weaker one.
+    """
+    name = None
+    strength = 0
+
+    def encode(self, pwd: str) -> str:
+        """ Hash a password, with the current parameters
+        """
+        raise NotImplementedError
+
+    def verify(self, pwd: str, encoded: str) -> bool:
+        """ Check a password against a stored hash
+        """
+        raise NotImplementedError
+
+    def load(self, stored: str):
+        """ Convert a hash read from file to its in-memory form
+        """
+        return stored
+
+    def dump(self, encoded) -> str:
+        """ Convert an in-memory hash to the form written to file
+        """
+        return encoded
+
+    def needs_update(self, encoded: str) -> bool:
+        """ Check if a stored hash was made with other parameters
+        """
+        return False
+
+    def calibrate(self, target: float) -> dict:
+        """ Return the parameters whose verify takes about `target` seconds
+        """
+        raise NotImplementedError
+
+
+class Sha256Hasher(Hasher):
+    """ Legacy unsalted SHA-256 hasher
+
+    Hashes are raw digests in memory and hex strings in the file, so a
+    verify compares two digests without building a hex string.
+    """
+    name = 'sha256'
+
+    def encode(self, pwd: str) -> bytes:
+        """ Hash a password
+        """
+        return hashlib.sha256(pwd.encode()).digest()
+
+    def verify(self, pwd: str, encoded: bytes) -> bool:
+        """ Check a password against a stored digest, in constant time
+        """
+        if not isinstance(encoded, bytes):
+            return False
+        return hmac.compare_digest(hashlib.sha256(pwd.encode()).digest(),
+                                   encoded)
+
+    def load(self, stored: str):
+        """ Convert a hex digest to bytes
+        """
+        try:
+            return bytes.fromhex(stored)
+        except ValueError:
+            return stored
+
+    def dump(self, encoded) -> str:
+        """ Convert a digest to lowercase hex
+        """
+        if isinstance(encoded, bytes):
+            return encoded.hex()
+        return encoded
+
+
+class ScryptHasher(Hasher):
+    """ scrypt hasher (hashlib.scrypt)
+
+    The cost is set by PASSWORD_SCRYPT_N (a power of 2, 2**14 by default)
+    """
+    name = 'scrypt'
+    strength = 1
+    r = 8
+    p = 1
+
+    def _n(self) -> int:
+        """ Current cost parameter
+        """
+        return int(getenv('PASSWORD_SCRYPT_N', 2 ** 14))
+
+    def _hash(self, pwd: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+        """ Raw scrypt hash of a password
+        """
+        return hashlib.scrypt(pwd.encode(), salt=salt, n=n, r=r, p=p,
+                              maxmem=128 * r * (n + p + 2) + 1024 * 1024,
+                              dklen=32)
+
+    def _decode(self, encoded: str) -> tuple:
+        """ Split a stored hash into (n, r, p, salt, hash)
+        """
+        _, params, salt, digest = encoded.split('$')
+        params = dict(param.split('=') for param in params.split(','))
+        return (int(params['n']), int(params['r']), int(params['p']),
+                bytes.fromhex(salt), bytes.fromhex(digest))
+
+    def encode(self, pwd: str) -> str:
+        """ Hash a password with a new random salt
+        """
+        n = self._n()
+        salt = os.urandom(16)
+        digest = self._hash(pwd, salt, n, self.r, self.p)
+        return "scrypt$n={},r={},p={}${}${}".format(
+            n, self.r, self.p, salt.hex(), digest.hex())
+
+    def verify(self, pwd: str, encoded: str) -> bool:
+        """ Check a password against a stored hash
+        """
+        try:
+            n, r, p, salt, digest = self._decode(encoded)
+        except (KeyError, ValueError):
+            return False
+        return hmac.compare_digest(self._hash(pwd, salt, n, r, p), digest)
+
+    def needs_update(self, encoded: str) -> bool:
+        """ Check if a stored hash was made with other parameters
+        """
+        try:
+            n, r, p, _, _ = self._decode(encoded)
+        except (KeyError, ValueError):
+            return True
+        return (n, r, p) != (self._n(), self.r, self.p)
+
+    def calibrate(self, target: float) -> dict:
+        """ Return the largest n whose verify takes at most `target` seconds
+        """
+        salt = os.urandom(16)
+        n = 2 ** 10
+        while True:
+            start = time.perf_counter()
+            self._hash('calibration', salt, n * 2, self.r, self.p)
+            if time.perf_counter() - start > target:
+                return {'PASSWORD_SCRYPT_N': n}
+            n *= 2
+
+
+class BcryptHasher(Hasher):
+    """ bcrypt hasher, when the bcrypt package is installed
+
+    The cost is set by PASSWORD_BCRYPT_ROUNDS (12 by default)
+    """
+    name = 'bcrypt'
+    strength = 1
+
+    def _rounds(self) -> int:
+        """ Current cost parameter
+        """
+        return int(getenv('PASSWORD_BCRYPT_ROUNDS', 12))
+
+    def encode(self, pwd: str) -> str:
+        """ Hash a password with a new random salt
+        """
+        salt = bcrypt.gensalt(self._rounds())
+        return 'bcrypt$' + bcrypt.hashpw(pwd.encode(), salt).decode()
+
+    def verify(self, pwd: str, encoded: str) -> bool:
+        """ Check a password against a stored hash
+        """
+        try:
+            return bcrypt.checkpw(pwd.encode(),
+                                  encoded.split('$', 1)[1].encode())
+        except ValueError:
+            return False
+
+    def needs_update(self, encoded: str) -> bool:
+        """ Check if a stored hash was made with another cost
+        """
+        # bcrypt hashes look like $2b$<rounds>$<salt and hash>
+        try:
+            rounds = int(encoded.split('$')[3])
+        except (IndexError, ValueError):
+            return True
+        return rounds != self._rounds()
+
+    def calibrate(self, target: float) -> dict:
+        """ Return the largest cost whose verify takes at most `target`
+        seconds
+        """
+        rounds = 4
+        while rounds < 31:
+            salt = bcrypt.gensalt(rounds + 1)
+            start = time.perf_counter()
+            bcrypt.hashpw(b'calibration', salt)
+            if time.perf_counter() - start > target:
+                break
+            rounds += 1
+        return {'PASSWORD_BCRYPT_ROUNDS': rounds}
+
+
+register_hasher(Sha256Hasher())
+register_hasher(ScryptHasher())
+if bcrypt is not None:
+    register_hasher(BcryptHasher())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Pick the cost of a password hasher for this host")
+    parser.add_argument('hasher', choices=sorted(
+        name for name in HASHERS if name != 'sha256'))
+    parser.add_argument('--target-ms', type=float, default=100,
+                        help="target verify latency in milliseconds")
+    args = parser.parse_args()
+
+    hasher = get_hasher(args.hasher)
+    params = hasher.calibrate(args.target_ms / 1000)
+    print("PASSWORD_HASHER={}".format(hasher.name))
+    for key, value in params.items():
+        print("{}={}".format(key, value))
+
+    # the hashers read their parameters from the environment
+    os.environ.update((key, str(value)) for key, value in params.items())
+    encoded = hasher.encode('calibration')
+    start = time.perf_counter()
+    hasher.verify('calibration', encoded)
+    print("# these parameters: verify in {:.1f} ms".format(
+        (time.perf_counter() - start) * 1000))
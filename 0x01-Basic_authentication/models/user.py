@@ -1,47 +1,70 @@
 #!/usr/bin/env python3
 """ User module
 """
-import hashlib
 from models.base import Base
+from models.hashers import dump_hash, get_hasher, identify_hasher, \
+    load_hash, needs_rehash
 
 
 class User(Base):
     """ User class
     """
+    __slots__ = ('email', '_password', 'first_name', 'last_name')
+    indexed_attributes = ('email',)
 
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a User instance
         """
         super().__init__(*args, **kwargs)
         self.email = kwargs.get('email')
-        self._password = kwargs.get('_password')
+        self._password = load_hash(kwargs.get('_password'))
         self.first_name = kwargs.get('first_name')
         self.last_name = kwargs.get('last_name')
 
     @property
     def password(self) -> str:
-        """ Getter of the password
+        """ Getter of the password hash, as written to file
         """
-        return self._password
+        return dump_hash(self._password)
 
     @password.setter
     def password(self, pwd: str):
-        """ Setter of a new password: encrypt in SHA256
+        """ Setter of a new password: hashed with the hasher of
+        PASSWORD_HASHER (SHA256 by default)
         """
         if pwd is None or type(pwd) is not str:
             self._password = None
         else:
-            self._password = hashlib.sha256(pwd.encode()).hexdigest().lower()
+            self._password = get_hasher().encode(pwd)
 
     def is_valid_password(self, pwd: str) -> bool:
         """ Validate a password
+
+        A valid password whose hash was made by a weaker hasher, or by
+        the current one with other parameters, is hashed again and the
+        user is saved.
         """
         if pwd is None or type(pwd) is not str:
             return False
-        if self.password is None:
+        if self._password is None:
+            return False
+        hasher = identify_hasher(self._password)
+        if hasher is None or not hasher.verify(pwd, self._password):
             return False
-        pwd_e = pwd.encode()
-        return hashlib.sha256(pwd_e).hexdigest().lower() == self.password
+        if needs_rehash(self._password):
+            self.password = pwd
+            if self._is_stored():
+                self.save()
+        return True
+
+    def to_json(self, for_serialization: bool = False) -> dict:
+        """ Convert the object a JSON dictionary, with the password hash
+        in its file form
+        """
+        result = super().to_json(for_serialization)
+        if result.get('_password') is not None:
+            result['_password'] = dump_hash(result['_password'])
+        return result
 
     def display_name(self) -> str:
         """ Display User name based on email/first_name/last_name
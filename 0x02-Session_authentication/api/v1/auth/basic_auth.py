@@ -6,14 +6,29 @@ Definition of a Basic Auth system.
 import base64
 import binascii
 from api.v1.auth.auth import Auth
+from api.v1.auth.credential_cache import CredentialCache
+from api.v1.metrics import METRICS
 from models.user import User
+from os import getenv
 from typing import TypeVar
 
 
 class BasicAuth(Auth):
     """ Implementation of a Basic Auth system.
+
+    Verified Authorization headers are cached, so repeated requests with
+    the same credentials skip the decoding, the user search and the
+    password check. The cache is sized with BASIC_AUTH_CACHE_SIZE
+    (0 disables it) and its entries live BASIC_AUTH_CACHE_TTL seconds.
     """
 
+    def __init__(self):
+        """ Initialize the Basic Auth system and its credential cache.
+        """
+        self.credential_cache = CredentialCache(
+            int(getenv('BASIC_AUTH_CACHE_SIZE', 1024)),
+            float(getenv('BASIC_AUTH_CACHE_TTL', 300)))
+
     def extract_base64_authorization_header(self, authorization_header: str) \
             -> str:
         """ Returns the authorization (auth) header's value.
@@ -105,15 +120,17 @@ class BasicAuth(Auth):
         if not user_pwd or not isinstance(user_pwd, str):
             return None
 
-        user_list = User.search({'email': user_email})
+        with METRICS.time('auth_phase_duration_seconds', 'user_lookup'):
+            user_list = User.search({'email': user_email})
         # when no user is found
         if len(user_list) == 0:
             return None
 
         user: User = user_list[0]
 
-        if not user.is_valid_password(user_pwd):
-            return None
+        with METRICS.time('auth_phase_duration_seconds', 'password_verify'):
+            if not user.is_valid_password(user_pwd):
+                return None
 
         return user
 
@@ -136,12 +153,51 @@ class BasicAuth(Auth):
             return None
 
         auth_value = self.authorization_header(request)
-        # retrieve just the base64 value of the auth header value
-        base64_value = self.extract_base64_authorization_header(auth_value)
-        # decode the base64 value
-        decoded_value = self.decode_base64_authorization_header(base64_value)
-        # separate the credentials
-        email, pwd = self.extract_user_credentials(decoded_value)
+
+        cache_key = None
+        if auth_value and self.credential_cache.max_size > 0:
+            with METRICS.time('auth_phase_duration_seconds',
+                              'credential_cache'):
+                cache_key = self.credential_cache.key(auth_value)
+                user = self.cached_user(cache_key)
+            if user is not None:
+                return user
+
+        with METRICS.time('auth_phase_duration_seconds', 'header_decode'):
+            # retrieve just the base64 value of the auth header value
+            base64_value = self.extract_base64_authorization_header(
+                auth_value)
+            # decode the base64 value
+            decoded_value = self.decode_base64_authorization_header(
+                base64_value)
+            # separate the credentials
+            email, pwd = self.extract_user_credentials(decoded_value)
 
         user = self.user_object_from_credentials(email, pwd)
+        if user is not None and cache_key is not None:
+            # the in-memory hash: `password` builds its file form
+            self.credential_cache.put(cache_key, user.id, user.email,
+                                      user._password)
+        return user
+
+    def cached_user(self, cache_key: bytes) -> TypeVar('User'):
+        """ Returns the User cached for already verified credentials.
+
+        The entry is dropped if the user was removed, or if its email or
+        password changed since the credentials were verified.
+        Returns:
+          - the cached user, if still valid.
+          - None otherwise.
+        """
+        entry = self.credential_cache.get(cache_key)
+        if entry is None:
+            return None
+
+        user_id, email, pwd_hash = entry
+        user = User.get(user_id)
+        if user is None or user.email != email or \
+                user._password != pwd_hash:
+            self.credential_cache.invalidate(cache_key)
+            return None
+
         return user
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Cache of verified credentials.
+"""
+from collections import OrderedDict
+from threading import Lock
+from typing import Tuple, Union
+import hashlib
+import hmac
+import os
+import time
+
+
+class CredentialCache:
+    """ Bounded LRU cache, with a TTL, of already verified credentials.
+
+    Entries are keyed by a keyed hash (HMAC-SHA256 with a per-process
+    random key) of the raw credentials, so the credentials themselves are
+    never kept in memory. An entry maps to the user id and to the email
+    and the in-memory password hash (`User._password`) the user had when
+    the credentials were verified; the caller checks them against the
+    current user to detect a password change or a removed user.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300):
+        """ Initialize the cache.
+
+        Args:
+            max_size(int): maximum number of entries, 0 disables the cache.
+            ttl(float): lifetime of an entry in seconds.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._key = os.urandom(32)
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def key(self, credentials: str) -> bytes:
+        """ Returns the keyed hash of the raw credentials.
+        """
+        return hmac.new(self._key, credentials.encode('utf-8'),
+                        hashlib.sha256).digest()
+
+    def get(self, key: bytes) -> Tuple[str, str, Union[bytes, str]]:
+        """ Returns the (user id, email, password hash) cached for a key.
+
+        Returns:
+          - None, if the key is not cached or its entry expired.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] <= now:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1:]
+
+    def put(self, key: bytes, user_id: str, email: str,
+            pwd_hash: Union[bytes, str]):
+        """ Caches the user verified for a key.
+
+        The least recently used entry is dropped when the cache is full.
+        """
+        if self.max_size <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            self._entries[key] = (expires_at, user_id, email, pwd_hash)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: bytes):
+        """ Drops the entry of a key, if any.
+
+        A lookup that ended up here is counted as a miss, not a hit.
+        """
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self.hits -= 1
+                self.misses += 1
+
+    def clear(self):
+        """ Drops every entry.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """ Returns the counters of the cache.
+        """
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
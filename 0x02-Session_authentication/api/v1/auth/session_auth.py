@@ -3,6 +3,7 @@
 Session authentication system
 """
 from api.v1.auth.auth import Auth
+from api.v1.metrics import METRICS
 from models.user import User
 from flask import Request
 from uuid import uuid4
@@ -61,12 +62,31 @@ class SessionAuth(Auth):
         if not request:
             return None
 
-        session_id = SessionAuth.session_cookie(self, request)
-        user_id = SessionAuth.user_id_for_session_id(self, session_id)
+        session_id = self.session_cookie(request)
+        with METRICS.time('auth_phase_duration_seconds', 'session_lookup'):
+            user_id = self.user_id_for_session_id(session_id)
 
         if not session_id or not user_id:
             return None
 
-        user = User.get(user_id)
+        with METRICS.time('auth_phase_duration_seconds', 'user_lookup'):
+            user = User.get(user_id)
 
         return user
+
+    def destroy_session(self, request: Request = None) -> bool:
+        """ Deletes the session of a request (logout).
+
+        Returns:
+          - True, if the session was deleted.
+          - False, if the request has no valid session.
+        """
+        if not request:
+            return False
+
+        session_id = self.session_cookie(request)
+        if not session_id or not self.user_id_for_session_id(session_id):
+            return False
+
+        SessionAuth.user_id_by_session_id.pop(session_id, None)
+        return True
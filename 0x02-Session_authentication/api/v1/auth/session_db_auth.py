@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Session authentication system with a persistent (SQLite) storage
+"""
+from api.v1.auth.session_exp_auth import SessionExpAuth
+from collections import OrderedDict
+from flask import Request
+from os import getenv
+from threading import Lock, local
+from uuid import uuid4
+import sqlite3
+import time
+
+
+class SessionDBAuth(SessionExpAuth):
+    """ Session Authentication mechanism storing sessions in SQLite.
+
+    Sessions are shared by every process using the same database file
+    (SESSION_DB_PATH), so they survive restarts and are visible to every
+    worker. The database runs in WAL mode so lookups are not blocked by
+    writers, and every thread has its own connection (sqlite3 keeps the
+    compiled statements of a connection in its statement cache).
+
+    Lookups go through an in-process read-through cache, whose entries
+    live SESSION_DB_CACHE_TTL seconds: a session destroyed by another
+    process can be accepted here for at most that long.
+    """
+
+    def __init__(self):
+        """ Initialize the storage and the read-through cache.
+        """
+        super().__init__()
+        self.db_path = getenv('SESSION_DB_PATH', '.db_UserSession.sqlite')
+        self.cache_ttl = float(getenv('SESSION_DB_CACHE_TTL', 5))
+        self.cache_size = int(getenv('SESSION_DB_CACHE_SIZE', 10000))
+        self._local = local()
+        self._cache = OrderedDict()
+        self._cache_lock = Lock()
+        self._last_purge = 0.0
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS user_session ('
+            'session_id TEXT PRIMARY KEY, '
+            'user_id TEXT NOT NULL, '
+            'created_at REAL NOT NULL)')
+        self._connection().execute(
+            'CREATE INDEX IF NOT EXISTS user_session_created_at '
+            'ON user_session (created_at)')
+
+    def _connection(self) -> sqlite3.Connection:
+        """ Returns the database connection of the current thread.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5,
+                                   isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _cache_get(self, session_id: str) -> tuple:
+        """ Returns the cached (user id, creation time) of a session.
+        """
+        now = time.monotonic()
+        with self._cache_lock:
+            entry = self._cache.get(session_id)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del self._cache[session_id]
+                return None
+            self._cache.move_to_end(session_id)
+            return entry[1:]
+
+    def _cache_put(self, session_id: str, user_id: str, created_at: float):
+        """ Caches a session, dropping the least recently used if full.
+        """
+        if self.cache_size <= 0:
+            return
+        expires_at = time.monotonic() + self.cache_ttl
+        with self._cache_lock:
+            self._cache[session_id] = (expires_at, user_id, created_at)
+            self._cache.move_to_end(session_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def create_session(self, user_id: str = None) -> str:
+        """ Creates a Session ID for a user_id and stores it in the database.
+
+        Returns:
+          - the session ID.
+          - None, if the user_id is invalid.
+        """
+        if not user_id or not isinstance(user_id, str):
+            return None
+
+        self.evict_expired_sessions()
+
+        session_id = str(uuid4())
+        created_at = time.time()
+        self._connection().execute(
+            'INSERT INTO user_session (session_id, user_id, created_at) '
+            'VALUES (?, ?, ?)', (session_id, user_id, created_at))
+        self._cache_put(session_id, user_id, created_at)
+
+        return session_id
+
+    def user_id_for_session_id(self, session_id: str = None) -> str:
+        """ Returns the User ID of a Session ID that has not expired.
+
+        Returns:
+          - the user id, if the session is found and still valid.
+          - None, if the session ID is invalid, not found or expired.
+        """
+        if not session_id or not isinstance(session_id, str):
+            return None
+
+        entry = self._cache_get(session_id)
+        if entry is None:
+            entry = self._connection().execute(
+                'SELECT user_id, created_at FROM user_session '
+                'WHERE session_id = ?', (session_id,)).fetchone()
+            if entry is None:
+                return None
+            self._cache_put(session_id, *entry)
+
+        user_id, created_at = entry
+        if self.session_duration > 0 and \
+                created_at + self.session_duration < time.time():
+            return None
+
+        return user_id
+
+    def destroy_session(self, request: Request = None) -> bool:
+        """ Deletes the session of a request.
+
+        Returns:
+          - True, if the session was deleted.
+          - False, if the request has no valid session.
+        """
+        if not request:
+            return False
+
+        session_id = self.session_cookie(request)
+        if not session_id or not self.user_id_for_session_id(session_id):
+            return False
+
+        with self._cache_lock:
+            self._cache.pop(session_id, None)
+        self._connection().execute(
+            'DELETE FROM user_session WHERE session_id = ?', (session_id,))
+
+        return True
+
+    def evict_expired_sessions(self) -> int:
+        """ Deletes the expired sessions from the database.
+
+        The purge runs at most once a minute, on the created_at index.
+        Returns:
+          - the number of deleted sessions.
+        """
+        if self.session_duration <= 0:
+            return 0
+
+        now = time.time()
+        if now - self._last_purge < 60:
+            return 0
+        self._last_purge = now
+
+        cursor = self._connection().execute(
+            'DELETE FROM user_session WHERE created_at < ?',
+            (now - self.session_duration,))
+        return cursor.rowcount
@@ -2,3 +2,111 @@
 """
 Session authentication system with expiration
 """
+from api.v1.auth.session_auth import SessionAuth
+from datetime import datetime, timedelta
+from os import getenv
+from threading import Lock
+import heapq
+
+
+class SessionExpAuth(SessionAuth):
+    """ Session Authentication mechanism with an expiration date.
+
+    Sessions last SESSION_DURATION seconds (forever if not set or <= 0).
+    Each session is also pushed on an expiry heap, so expired sessions are
+    evicted from the storage in amortized O(log n) on every create/lookup,
+    instead of staying in memory until they are looked up again.
+    """
+    # (expiration date, session ID) of the sessions, soonest first
+    session_expiry_heap = []
+    _expiry_lock = Lock()
+
+    def __init__(self):
+        """ Initialize the session duration from SESSION_DURATION.
+        """
+        try:
+            self.session_duration = int(getenv('SESSION_DURATION', 0))
+        except ValueError:
+            self.session_duration = 0
+
+    def create_session(self, user_id: str = None) -> str:
+        """ Creates a Session ID for a user_id, and stores its creation date.
+
+        Returns:
+          - the session ID.
+          - None, if the session could not be created.
+        """
+        self.evict_expired_sessions()
+
+        session_id = super().create_session(user_id)
+        if session_id is None:
+            return None
+
+        created_at = datetime.now()
+        SessionAuth.user_id_by_session_id[session_id] = {
+            'user_id': user_id,
+            'created_at': created_at,
+        }
+
+        if self.session_duration > 0:
+            expires_at = created_at + \
+                timedelta(seconds=self.session_duration)
+            with SessionExpAuth._expiry_lock:
+                heapq.heappush(SessionExpAuth.session_expiry_heap,
+                               (expires_at, session_id))
+
+        return session_id
+
+    def user_id_for_session_id(self, session_id: str = None) -> str:
+        """ Returns the User ID of a Session ID that has not expired.
+
+        Returns:
+          - the user id, if the session is found and still valid.
+          - None, if the session ID is invalid, not found or expired.
+        """
+        if not session_id or not isinstance(session_id, str):
+            return None
+
+        self.evict_expired_sessions()
+
+        session_dict = SessionAuth.user_id_by_session_id.get(session_id)
+        if not isinstance(session_dict, dict):
+            return None
+
+        if self.session_duration <= 0:
+            return session_dict.get('user_id')
+
+        created_at = session_dict.get('created_at')
+        if created_at is None:
+            return None
+
+        expires_at = created_at + timedelta(seconds=self.session_duration)
+        if expires_at < datetime.now():
+            return None
+
+        return session_dict.get('user_id')
+
+    def evict_expired_sessions(self) -> int:
+        """ Removes the expired sessions from the storage.
+
+        Only the head of the expiry heap is looked at, so the cost is
+        proportional to the number of evicted sessions.
+        Returns:
+          - the number of evicted sessions.
+        """
+        if self.session_duration <= 0:
+            return 0
+
+        now = datetime.now()
+        heap = SessionExpAuth.session_expiry_heap
+        evicted = 0
+        with SessionExpAuth._expiry_lock:
+            while heap and heap[0][0] < now:
+                expires_at, session_id = heapq.heappop(heap)
+                session_dict = SessionAuth.user_id_by_session_id.get(
+                    session_id)
+                if isinstance(session_dict, dict):
+                    SessionAuth.user_id_by_session_id.pop(session_id, None)
+                    evicted += 1
+
+        return evicted
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """ Module of Index views
 """
-from flask import jsonify, abort
+from flask import jsonify, abort, Response
 from api.v1.views import app_views
 
 
@@ -19,13 +19,29 @@ def stats() -> str:
     """ GET /api/v1/stats
     Return:
       - the number of each objects
+      - the counters of the credential cache, with Basic authentication
     """
     from models.user import User
+    from api.v1.app import auth
     stats = {}
     stats['users'] = User.count()
+    credential_cache = getattr(auth, 'credential_cache', None)
+    if credential_cache is not None:
+        stats['credential_cache'] = credential_cache.stats()
     return jsonify(stats)
 
 
+@app_views.route('/metrics', methods=['GET'], strict_slashes=False)
+def metrics() -> str:
+    """ GET /api/v1/metrics
+    Return:
+      - the request and authentication metrics, in the Prometheus text
+      format
+    """
+    from api.v1.metrics import METRICS, CONTENT_TYPE
+    return Response(METRICS.render(), content_type=CONTENT_TYPE)
+
+
 @app_views.route('/unauthorized', strict_slashes=False)
 def unauthorized_handler() -> str:
     """ GET /api/v1/unauthorized
@@ -42,3 +42,20 @@ def login():
     response.set_cookie(cookie_name, session_id)
 
     return response
+
+
+@app_views.route('/auth_session/logout', methods=['DELETE'],
+                 strict_slashes=False)
+def logout():
+    """ DELETE /auth_session/logout
+
+    Deletes the session of the logged in user.
+    Return:
+      - empty JSON, if the session has been deleted
+      - 404 if the request has no valid session
+    """
+    from api.v1.app import auth
+    if not auth.destroy_session(request):
+        abort(404)
+
+    return jsonify({}), 200
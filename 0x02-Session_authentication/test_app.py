@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+""" Lookups of the current user per request
+
+The user of a request is resolved once by `authentication_check`, and
+reused by the views, including `GET /api/v1/users/me`.
+
+Run from this directory with:
+    python3 -m unittest test_app
+"""
+import os
+import tempfile
+import unittest
+
+
+class TestCurrentUserLookups(unittest.TestCase):
+    """ Count the calls to auth.current_user, with session auth
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        """ Start the app with session auth, in a scratch directory where
+        the models keep their files
+        """
+        cls.cwd = os.getcwd()
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(cls.tmp_dir.name)
+        os.environ['AUTH_TYPE'] = 'session_auth'
+        os.environ['SESSION_NAME'] = '_my_session_id'
+
+        from api.v1 import app as app_module
+        from models.user import User
+        cls.app_module = app_module
+        user = User(email='bob@example.com')
+        user.password = 'pwd'
+        user.save()
+        cls.user = user
+
+    @classmethod
+    def tearDownClass(cls):
+        """ Leave the scratch directory
+        """
+        os.chdir(cls.cwd)
+        cls.tmp_dir.cleanup()
+        os.environ.pop('AUTH_TYPE', None)
+        os.environ.pop('SESSION_NAME', None)
+
+    def setUp(self):
+        """ Log in, then count the calls to auth.current_user
+        """
+        self.client = self.app_module.app.test_client()
+        response = self.client.post('/api/v1/auth_session/login', data={
+            'email': 'bob@example.com', 'password': 'pwd'})
+        self.assertEqual(response.status_code, 200)
+
+        auth = self.app_module.auth
+        current_user = auth.current_user
+        self.calls = 0
+
+        def counting_current_user(request=None):
+            self.calls += 1
+            return current_user(request)
+
+        auth.current_user = counting_current_user
+        self.addCleanup(delattr, auth, 'current_user')
+
+    def test_protected_route(self):
+        """ A protected route looks the user up once
+        """
+        response = self.client.get('/api/v1/users')
+        self.assertEqual(response.status_code, 200)
+        response.get_data()
+        self.assertEqual(self.calls, 1)
+
+    def test_users_me(self):
+        """ GET /api/v1/users/me reuses the user of the request
+        """
+        response = self.client.get('/api/v1/users/me')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['id'], self.user.id)
+        self.assertEqual(self.calls, 1)
+
+    def test_without_session(self):
+        """ A request without session is rejected after a single lookup
+        """
+        self.client.delete_cookie('_my_session_id')
+        response = self.client.get('/api/v1/users')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.calls, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,14 +2,69 @@
 """
 Module for the Flask app.
 """
-from auth import Auth
+from auth import Auth, HASH_POOL
+from hash_pool import HashPoolSaturated
+from metrics import CONTENT_TYPE, METRICS
+from profiler import profiler_middleware
 from flask import Flask, abort, jsonify, request, Response, Request, redirect
+import time
 
 
 app = Flask(__name__)
+app.wsgi_app = profiler_middleware(app.wsgi_app)
 AUTH = Auth()
 
 
+def service_metrics() -> list:
+    """Metrics of the hashing pool and of the session cache.
+    """
+    pool = HASH_POOL.stats()
+    cache = AUTH.session_cache_stats()
+    return [
+        ('hash_pool_calls_total', 'counter',
+         "Hashing calls run by the pool", {(): pool['calls']}, ()),
+        ('hash_pool_rejected_total', 'counter',
+         "Hashing calls rejected as the pool was saturated",
+         {(): pool['rejected']}, ()),
+        ('hash_pool_in_flight', 'gauge',
+         "Hashing calls waiting or running", {(): pool['in_flight']}, ()),
+        ('hash_pool_queue_depth', 'gauge',
+         "Hashing calls waiting for a worker", {(): pool['queue_depth']},
+         ()),
+        ('session_cache_lookups_total', 'counter',
+         "Lookups of the session cache",
+         {('hit',): cache['hits'], ('miss',): cache['misses']},
+         ('result',)),
+        ('session_cache_size', 'gauge',
+         "Entries of the session cache", {(): cache['size']}, ()),
+    ]
+
+
+METRICS.add_collector(service_metrics)
+
+
+@app.before_request
+def start_timer():
+    """Records the start of the request, for its duration metric.
+    """
+    request.start_time = time.perf_counter()
+
+
+@app.after_request
+def record_request(response: Response) -> Response:
+    """Records the duration of the request, per route and status.
+    """
+    start_time = getattr(request, 'start_time', None)
+    if start_time is not None:
+        rule = request.url_rule
+        METRICS.observe('http_request_duration_seconds',
+                        (request.method,
+                         rule.rule if rule is not None else 'unmatched',
+                         str(response.status_code)),
+                        time.perf_counter() - start_time)
+    return response
+
+
 @app.route("/", methods=["GET"], strict_slashes=False)
 def index():
     """GET /
@@ -90,7 +145,7 @@ def logout():
     if not user:
         abort(403)
 
-    AUTH.destroy_session(user.id)
+    AUTH.destroy_session(user.id, session_id)
     return redirect('/', code=302)
 
 
@@ -155,5 +210,25 @@ def update_password():
     return jsonify({"email": email, "message": "Password updated"})
 
 
+@app.route('/metrics', methods=['GET'], strict_slashes=False)
+def metrics() -> str:
+    """GET /metrics
+
+    Returns:
+      - the request, authentication, hashing pool and session cache
+      metrics, in the Prometheus text format.
+    """
+    return Response(METRICS.render(), content_type=CONTENT_TYPE)
+
+
+@app.errorhandler(HashPoolSaturated)
+def too_many_requests(error) -> str:
+    """Too many requests handler, when the password hashing is saturated.
+    """
+    response: Response = jsonify({"error": "Too many requests"})
+    response.headers['Retry-After'] = '1'
+    return response, 429
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port="5000")
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Module for the asyncio (ASGI) version of the app.
+
+Same routes as the Flask app of the `app` module, served by Quart on top
+of AsyncAuth. Run it with any ASGI server, e.g.:
+    hypercorn async_app:app
+"""
+from async_auth import AsyncAuth
+from auth import HASH_POOL
+from hash_pool import HashPoolSaturated
+from metrics import CONTENT_TYPE, METRICS
+from quart import Quart, Response, abort, jsonify, request, redirect
+import time
+
+
+app = Quart(__name__)
+AUTH = AsyncAuth()
+
+
+@app.before_serving
+async def init_db():
+    """Creates the database tables before serving requests.
+    """
+    await AUTH.init()
+
+
+def service_metrics() -> list:
+    """Metrics of the hashing pool.
+    """
+    pool = HASH_POOL.stats()
+    return [
+        ('hash_pool_calls_total', 'counter',
+         "Hashing calls run by the pool", {(): pool['calls']}, ()),
+        ('hash_pool_rejected_total', 'counter',
+         "Hashing calls rejected as the pool was saturated",
+         {(): pool['rejected']}, ()),
+        ('hash_pool_in_flight', 'gauge',
+         "Hashing calls waiting or running", {(): pool['in_flight']}, ()),
+        ('hash_pool_queue_depth', 'gauge',
+         "Hashing calls waiting for a worker", {(): pool['queue_depth']},
+         ()),
+    ]
+
+
+METRICS.add_collector(service_metrics)
+
+
+@app.before_request
+async def start_timer():
+    """Records the start of the request, for its duration metric.
+    """
+    request.start_time = time.perf_counter()
+
+
+@app.after_request
+async def record_request(response):
+    """Records the duration of the request, per route and status.
+    """
+    start_time = getattr(request, 'start_time', None)
+    if start_time is not None:
+        rule = request.url_rule
+        METRICS.observe('http_request_duration_seconds',
+                        (request.method,
+                         rule.rule if rule is not None else 'unmatched',
+                         str(response.status_code)),
+                        time.perf_counter() - start_time)
+    return response
+
+
+@app.route("/", methods=["GET"], strict_slashes=False)
+async def index():
+    """GET /
+    Returns:
+      - {"message": "Bienvenue"}
+    """
+    return jsonify({"message": "Bienvenue"})
+
+
+@app.route("/users", methods=["POST"], strict_slashes=False)
+async def users():
+    """POST /users
+    Registers a new user to the app.
+
+    Returns:
+      - 201 status, upon successful addition to the app.
+    """
+    form = await request.form
+    email = form.get('email')
+    password = form.get('password')
+
+    if not email:
+        return jsonify({"error": "<email> is missing"}), 400
+
+    if not password:
+        return jsonify({"error": "<password> is missing"}), 400
+
+    try:
+        await AUTH.register_user(email, password)
+    except ValueError:
+        return jsonify({"message": "email already registered"}), 400
+
+    return jsonify({"email": email, "message": "user created"})
+
+
+@app.route('/sessions', methods=["POST"], strict_slashes=False)
+async def login():
+    """POST /sessions
+
+    Authenticate login credentials and if valid then
+    a session is created for the user.
+
+    Returns:
+      - 200 status, for successful login.
+      - 401 status, for invalid credentials.
+    """
+    form = await request.form
+    email = form.get('email')
+    password = form.get('password')
+
+    if not email or not password:
+        abort(401)
+
+    if not await AUTH.valid_login(email, password):
+        abort(401)
+
+    session_id: str = await AUTH.create_session(email)
+
+    response = jsonify({"email": email, "message": "logged in"})
+    response.set_cookie('session_id', session_id)
+
+    return response
+
+
+@app.route('/sessions', methods=['DELETE'], strict_slashes=False)
+async def logout():
+    """DELETE /sessions
+    Sign-out an user by deleting the existing session id.
+
+    Returns:
+      - 302 status, redirection to `/` once signed out.
+      - 403 status, if the user does not exist
+    """
+    session_id: str = request.cookies.get('session_id')
+
+    if not session_id:
+        abort(403)
+
+    user = await AUTH.get_user_from_session_id(session_id)
+    if not user:
+        abort(403)
+
+    await AUTH.destroy_session(user.id, session_id)
+    return redirect('/', code=302)
+
+
+@app.route('/profile', methods=['GET'], strict_slashes=False)
+async def profile():
+    """GET /profile
+
+    Requires Authorization (session id as a cookie).
+    Provides the user's email address.
+    """
+    session_id = request.cookies.get('session_id')
+    if not session_id:
+        abort(403)
+
+    user = await AUTH.get_user_from_session_id(session_id)
+    if not user:
+        abort(403)
+
+    return jsonify({"email": user.email})
+
+
+@app.route('/reset_password', methods=['POST'], strict_slashes=False)
+async def get_reset_password_token():
+    """POST /reset_password
+
+    Generates and returns a reset token.
+    Returns:
+      - 200 status + json payload, for success.
+      - 403 status, for an unknown email.
+    """
+    form = await request.form
+    email = form.get('email')
+
+    try:
+        reset_token: str = await AUTH.get_reset_password_token(email)
+    except ValueError:
+        abort(403)
+    if not reset_token:
+        abort(403)
+
+    return jsonify({"email": email, "reset_token": reset_token})
+
+
+@app.route('/reset_password', methods=['PUT'], strict_slashes=False)
+async def update_password():
+    """PUT /reset_password
+
+    Updates the user's password if the reset token is correct.
+    Returns:
+      - 403 status, if the token or form data is invalid.
+      - 200 status + json payload, for valid token.
+    """
+    form = await request.form
+    email = form.get('email')
+    reset_token = form.get('reset_token')
+    new_password = form.get('new_password')
+
+    if not email or not reset_token or not new_password:
+        abort(403)
+
+    try:
+        await AUTH.update_password(reset_token, new_password)
+    except ValueError:
+        abort(403)
+
+    return jsonify({"email": email, "message": "Password updated"})
+
+
+@app.route('/metrics', methods=['GET'], strict_slashes=False)
+async def metrics():
+    """GET /metrics
+
+    Returns:
+      - the request, authentication and hashing pool metrics, in the
+      Prometheus text format.
+    """
+    return Response(METRICS.render(), content_type=CONTENT_TYPE)
+
+
+@app.errorhandler(HashPoolSaturated)
+async def too_many_requests(error):
+    """Too many requests handler, when the password hashing is saturated.
+    """
+    response = jsonify({"error": "Too many requests"})
+    response.headers['Retry-After'] = '1'
+    return response, 429
+
+
+if __name__ == "__main__":
+    app.run(host="0.0.0.0", port=5000)
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Async authentication, the asyncio counterpart of the auth module.
+"""
+from async_db import AsyncDB
+from auth import HASH_POOL, _generate_uuid
+from bcrypt import gensalt, hashpw, checkpw
+from datetime import datetime, timedelta
+from metrics import METRICS
+from os import getenv
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import NoResultFound
+from user import User
+
+
+async def _hash_password(password: str) -> bytes:
+    """Hashes a password on HASH_POOL, without blocking the event loop.
+
+    Raises:
+      - HashPoolSaturated: if the hashing pool is saturated.
+    Returns:
+      - bytes, which is a salted hash of the given password.
+    """
+    if not isinstance(password, str):
+        raise TypeError('`password` should be a string')
+
+    b_password = password.encode('utf-8')
+    with METRICS.time('auth_phase_duration_seconds', 'bcrypt'):
+        return await HASH_POOL.run_async(hashpw, b_password, gensalt())
+
+
+class AsyncAuth:
+    """AsyncAuth class to interact with the authentication database.
+
+    Same behaviour as Auth, with coroutines. Sessions are not cached
+    and their last seen time is not tracked. Expired reset tokens are
+    purged by the background task of Auth only.
+    """
+
+    def __init__(self):
+        self._db = AsyncDB()
+        self._session_duration = int(getenv('AUTH_SESSION_DURATION', 0))
+        self._reset_token_ttl = int(getenv('AUTH_RESET_TOKEN_TTL', 3600))
+
+    async def init(self) -> None:
+        """Creates the database tables.
+        """
+        await self._db.init()
+
+    async def register_user(self, email: str, password: str) -> User:
+        """Saves a new user to the database, relying on the unique
+        constraint on the email to reject duplicates.
+
+        Raises:
+          - ValueError: if a user with the same email already exists.
+        Returns:
+          - The registered user.
+        """
+        if not isinstance(email, str):
+            raise TypeError('<email> should be a string')
+        if not isinstance(password, str):
+            raise TypeError('<password> should be a string')
+
+        if not email:
+            raise ValueError('<email> should not be empty')
+        if not password:
+            raise ValueError('<password> should not be empty')
+
+        hashed_password: bytes = await _hash_password(password)
+        try:
+            return await self._db.add_user(email, hashed_password)
+        except IntegrityError:
+            raise ValueError(f"User {email} already exists")
+
+    async def valid_login(self, email: str, password: str) -> bool:
+        """Checks the authenticity of a user's login details.
+
+        Returns:
+          - True if all the credentials of the user is correct
+          - False if the credentials are incorrect.
+        """
+        if not email or not password:
+            return False
+
+        try:
+            with METRICS.time('auth_phase_duration_seconds', 'user_lookup'):
+                user = await self._db.find_user_by(email=email)
+        except NoResultFound:
+            return False
+
+        with METRICS.time('auth_phase_duration_seconds', 'bcrypt'):
+            return await HASH_POOL.run_async(checkpw,
+                                             password.encode('utf-8'),
+                                             user.hashed_password)
+
+    async def create_session(self, email: str) -> str:
+        """Provides a session ID as a string.
+
+        Returns:
+          - the generated session id for the user.
+        """
+        if not email:
+            return None
+
+        try:
+            user = await self._db.find_user_by(email=email)
+        except NoResultFound:
+            return None
+
+        session_id: str = _generate_uuid()
+        expires_at = None
+        if self._session_duration > 0:
+            expires_at = datetime.utcnow() + \
+                timedelta(seconds=self._session_duration)
+        await self._db.add_session(user.id, session_id, expires_at)
+
+        return session_id
+
+    async def get_user_from_session_id(self, session_id: str) -> User:
+        """Returns an user associated with the given session id.
+
+        Returns:
+          - the User corresponding to the session id.
+          - otherwise None.
+        """
+        if not session_id:
+            return None
+
+        try:
+            with METRICS.time('auth_phase_duration_seconds',
+                              'session_lookup'):
+                return await self._db.find_user_by_session(session_id)
+        except NoResultFound:
+            return None
+
+    async def destroy_session(self, user_id: str,
+                              session_id: str = None) -> None:
+        """Deletes a session of a user, or all of them.
+        """
+        if not user_id:
+            return None
+
+        await self._db.delete_sessions(user_id, session_id)
+        return None
+
+    async def get_reset_password_token(self, email: str) -> str:
+        """Provides a reset password token.
+
+        Exception:
+          - ValueError: If the user does not exist.
+        Returns:
+          - the reset password token.
+        """
+        if not email:
+            return None
+
+        reset_pwd_token = _generate_uuid()
+        expires_at = None
+        if self._reset_token_ttl > 0:
+            expires_at = datetime.utcnow() + \
+                timedelta(seconds=self._reset_token_ttl)
+        if not await self._db.set_reset_token(email, reset_pwd_token,
+                                              expires_at):
+            raise ValueError('The user does not exist')
+
+        return reset_pwd_token
+
+    async def update_password(self, reset_token: str, password: str) -> None:
+        """Updates the password of an user with a valid reset token.
+
+        Like Auth.update_password, an unknown or expired token is rejected
+        before the new password is hashed.
+
+        Exception:
+          - ValueError: if invalid args ar provided or,
+          if the token is unknown, expired or already used.
+        """
+        if not reset_token or not password:
+            raise ValueError
+
+        if not await self._db.is_reset_token_valid(reset_token):
+            raise ValueError
+
+        hashed_password = await _hash_password(password)
+        if not await self._db.consume_reset_token(reset_token,
+                                                  hashed_password):
+            raise ValueError
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""Async DB module
+"""
+from datetime import datetime
+from os import getenv
+from sqlalchemy import delete, event, select, update
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm.exc import NoResultFound
+
+from db import _migrate_schema, _set_sqlite_pragmas, _valid_reset_token
+from user import Base, User, UserSession
+
+
+class AsyncDB:
+    """AsyncDB class, the asyncio counterpart of DB.
+
+    Every method runs in its own short-lived AsyncSession, so the object
+    can be shared by all the tasks of the event loop.
+    """
+
+    def __init__(self, url: str = None) -> None:
+        """Initialize a new AsyncDB instance
+
+        The URL comes from the argument or else AUTH_DB_URL (default
+        `sqlite:///a.db`). SQLite URLs use the aiosqlite driver.
+        The tables are created by `init`.
+        """
+        if url is None:
+            url = getenv("AUTH_DB_URL", "sqlite:///a.db")
+
+        db_url = make_url(url)
+        is_sqlite = db_url.get_backend_name() == "sqlite"
+        if is_sqlite and db_url.drivername == "sqlite":
+            db_url = db_url.set(drivername="sqlite+aiosqlite")
+
+        self._engine = create_async_engine(db_url, echo=False,
+                                           pool_pre_ping=True)
+        if is_sqlite:
+            event.listen(self._engine.sync_engine, "connect",
+                         _set_sqlite_pragmas)
+        self._session_factory = sessionmaker(
+            bind=self._engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def init(self, reset: bool = None) -> None:
+        """Creates the tables.
+
+        With reset (AUTH_DB_RESET, false by default), the tables are
+        dropped first, like DB does. Otherwise the missing columns and
+        indexes are added to the existing tables.
+        """
+        if reset is None:
+            reset = getenv("AUTH_DB_RESET", "0").lower() in \
+                ("1", "true", "yes")
+
+        async with self._engine.begin() as conn:
+            if reset:
+                await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(_migrate_schema)
+
+    async def close(self) -> None:
+        """Closes all the connections of the engine.
+        """
+        await self._engine.dispose()
+
+    async def add_user(self, email, hashed_password) -> User:
+        """Saves a new user to the database.
+        No validation is done.
+        Raises:
+          - IntegrityError: when a user already has this email.
+        Returns:
+          - The new user.
+        """
+        user: User = User(email=email, hashed_password=hashed_password)
+        async with self._session_factory() as session:
+            session.add(user)
+            await session.commit()
+
+        return user
+
+    async def find_user_by(self, **kwargs) -> User:
+        """Looks for the first user matching the keyword arguments.
+
+        Raises:
+          - InvalidRequestError: when any keyworded argument is invalid
+          (not an attribute of user).
+          - NoResultFound: when a user is not found with the database query.
+        Returns:
+          - the first record of the matched query for the user table.
+        """
+        valid_keys = ['id', 'email', 'hashed_password',
+                      'session_id', 'reset_token']
+
+        for key in kwargs.keys():
+            if key not in valid_keys:
+                raise InvalidRequestError
+
+        async with self._session_factory() as session:
+            result = await session.execute(
+                select(User).filter_by(**kwargs).limit(1))
+            user: User = result.scalars().first()
+
+        if not user:
+            raise NoResultFound
+
+        return user
+
+    async def update_user(self, user_id: int, **kwargs) -> None:
+        """Updates a user's attributes with a single UPDATE statement.
+
+        Raises:
+          - TypeError: when an invalid keyword argument is passed.
+          - NoResultFound: when no user has this id.
+        Returns:
+          - None
+        """
+        columns = User.__table__.columns.keys()
+        for key in kwargs.keys():
+            if key not in columns or key == 'id':
+                raise TypeError
+
+        if not kwargs:
+            await self.find_user_by(id=user_id)
+            return None
+
+        async with self._session_factory() as session:
+            result = await session.execute(
+                update(User).where(User.id == user_id).values(**kwargs))
+            await session.commit()
+
+        if result.rowcount == 0:
+            raise NoResultFound
+        return None
+
+    async def set_reset_token(self, email: str, reset_token: str,
+                              expires_at: datetime = None) -> bool:
+        """Gives a new reset token to the user of an email, in a single
+        UPDATE statement.
+        Returns:
+          - False if no user has this email.
+        """
+        async with self._session_factory() as session:
+            result = await session.execute(
+                update(User).where(User.email == email)
+                .values(reset_token=reset_token,
+                        reset_token_expires_at=expires_at))
+            await session.commit()
+
+        return result.rowcount > 0
+
+    async def is_reset_token_valid(self, reset_token: str) -> bool:
+        """Checks, with an indexed SELECT, that a reset token exists and
+        has not expired.
+        """
+        async with self._session_factory() as session:
+            result = await session.execute(
+                select(User.id).where(_valid_reset_token(reset_token))
+                .limit(1))
+            return result.first() is not None
+
+    async def consume_reset_token(self, reset_token: str,
+                                  hashed_password: bytes) -> bool:
+        """Sets the password of the user of a reset token that has not
+        expired, and clears the token, in a single conditional UPDATE.
+        Returns:
+          - False if the token is unknown, expired or already consumed.
+        """
+        async with self._session_factory() as session:
+            result = await session.execute(
+                update(User)
+                .where(_valid_reset_token(reset_token))
+                .values(hashed_password=hashed_password, reset_token=None,
+                        reset_token_expires_at=None))
+            await session.commit()
+
+        return result.rowcount > 0
+
+    async def add_session(self, user_id: int, session_id: str,
+                          expires_at: datetime = None) -> None:
+        """Saves a new session of a user.
+        """
+        now = datetime.utcnow()
+        async with self._session_factory() as session:
+            session.add(UserSession(session_id=session_id, user_id=user_id,
+                                    created_at=now, last_seen=now,
+                                    expires_at=expires_at))
+            await session.commit()
+
+    async def find_user_by_session(self, session_id: str) -> User:
+        """Returns the user of a session that has not expired.
+
+        Raises:
+          - NoResultFound: when the session is not found or expired.
+        """
+        now = datetime.utcnow()
+        async with self._session_factory() as session:
+            result = await session.execute(
+                select(User)
+                .join(UserSession, UserSession.user_id == User.id)
+                .where(UserSession.session_id == session_id)
+                .where((UserSession.expires_at == None) |  # noqa: E711
+                       (UserSession.expires_at > now))
+                .limit(1))
+            user: User = result.scalars().first()
+
+        if not user:
+            raise NoResultFound
+
+        return user
+
+    async def delete_sessions(self, user_id: int,
+                              session_id: str = None) -> int:
+        """Deletes one session of a user, or all of them.
+        Returns:
+          - the number of deleted sessions.
+        """
+        stmt = delete(UserSession).where(UserSession.user_id == user_id)
+        if session_id is not None:
+            stmt = stmt.where(UserSession.session_id == session_id)
+        async with self._session_factory() as session:
+            result = await session.execute(stmt)
+            await session.commit()
+
+        return result.rowcount
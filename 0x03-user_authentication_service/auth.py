@@ -3,15 +3,29 @@
 Main file
 """
 from bcrypt import gensalt, hashpw, checkpw
+from datetime import datetime, timedelta
 from db import DB
+from hash_pool import HashPool
+from metrics import METRICS
+from os import getenv
+from session_cache import SessionCache, SessionUser
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm.exc import NoResultFound
+from threading import Lock, Thread
 from uuid import uuid4
+import time
 from user import User
 
+# bcrypt calls run on this bounded pool, not on the request threads
+HASH_POOL = HashPool()
+
 
 def _hash_password(password: str) -> bytes:
     """Hashes a password.
 
+    The hashing runs on HASH_POOL.
+    Raises:
+      - HashPoolSaturated: if the hashing pool is saturated.
     Returns:
       - bytes, which is a salted hash of the given password.
     """
@@ -23,7 +37,8 @@ def _hash_password(password: str) -> bytes:
         b_password = password.encode('utf-8')
 
         salt = gensalt()
-        hashed_password: bytes = hashpw(b_password, salt)
+        with METRICS.time('auth_phase_duration_seconds', 'bcrypt'):
+            hashed_password: bytes = HASH_POOL.run(hashpw, b_password, salt)
 
     except UnicodeEncodeError:
         raise UnicodeEncodeError
@@ -40,10 +55,68 @@ def _generate_uuid() -> str:
 
 class Auth:
     """Auth class to interact with the authentication database.
+
+    The users of the sessions are cached in memory
+    (AUTH_SESSION_CACHE_SIZE entries living AUTH_SESSION_CACHE_TTL
+    seconds). With AUTH_SESSION_CACHE_SHARED set, a generation counter
+    stored in the database invalidates the cache when another process
+    destroys a session.
+
+    A user can have several sessions, which last AUTH_SESSION_DURATION
+    seconds (forever if 0, the default). The last time each session is
+    seen is kept in memory and saved in one batch every
+    AUTH_SESSION_FLUSH_INTERVAL seconds by a background thread, which also
+    purges the expired sessions and reset tokens. With an interval of 0
+    there is no thread: the last seen times are not recorded, and
+    create_session purges the expired sessions and reset tokens, at most
+    once per session duration.
+
+    Reset tokens can be used once, within AUTH_RESET_TOKEN_TTL seconds
+    (3600 by default, forever if 0).
     """
 
     def __init__(self):
         self._db = DB()
+        self._session_cache = SessionCache(
+            int(getenv('AUTH_SESSION_CACHE_SIZE', 10000)),
+            float(getenv('AUTH_SESSION_CACHE_TTL', 30)))
+        self._shared_session_cache = getenv(
+            'AUTH_SESSION_CACHE_SHARED', '').lower() in ('1', 'true', 'yes')
+        self._session_duration = int(getenv('AUTH_SESSION_DURATION', 0))
+        self._reset_token_ttl = int(getenv('AUTH_RESET_TOKEN_TTL', 3600))
+        self._last_seen = {}
+        self._last_seen_lock = Lock()
+
+        flush_interval = float(getenv('AUTH_SESSION_FLUSH_INTERVAL', 60))
+        # nothing would ever empty the last seen times without the thread
+        self._track_last_seen = flush_interval > 0
+        self._next_purge = 0.0
+        if flush_interval > 0:
+            Thread(target=self._maintain_sessions, args=(flush_interval,),
+                   daemon=True).start()
+
+    def _maintain_sessions(self, interval: float) -> None:
+        """Background loop flushing the sessions and purging the expired
+        reset tokens every `interval` seconds.
+        """
+        while True:
+            time.sleep(interval)
+            try:
+                self.flush_sessions()
+                if self._reset_token_ttl > 0:
+                    self._db.purge_expired_reset_tokens()
+            except Exception:
+                # try again at the next round
+                pass
+
+    def flush_sessions(self) -> None:
+        """Saves the pending last seen times and purges expired sessions.
+        """
+        with self._last_seen_lock:
+            last_seen, self._last_seen = self._last_seen, {}
+        self._db.touch_sessions(last_seen)
+        if self._session_duration > 0:
+            self._db.purge_expired_sessions()
 
     def register_user(self, email: str, password: str) -> User:
         """Saves a new user to the database.
@@ -52,6 +125,9 @@ class Auth:
           - This module's `_hash_password` is used to hash the password before
           storing it in the database.
 
+        The user is inserted directly: the unique constraint on the email
+        rejects duplicates, even between concurrent registrations.
+
         Raises:
           - ValueError: if a user with the same email already exists.
         Returns:
@@ -67,14 +143,12 @@ class Auth:
         if not password:
             raise ValueError('<password> should not be empty')
 
+        hashed_password: bytes = _hash_password(password)
         try:
-            user = self._db.find_user_by(email=email)
-
-            # an exception is raised since user already exists with this email
-            raise ValueError(f"User {email} already exists")
-        except NoResultFound:
-            hashed_password: bytes = _hash_password(password)
             user = self._db.add_user(email, hashed_password)
+        except IntegrityError:
+            # a user already exists with this email
+            raise ValueError(f"User {email} already exists")
 
         return user
 
@@ -82,7 +156,9 @@ class Auth:
         """Checks the authenticity of a user's login details.
 
         The user is located via their email, and their password is then
-        checked with bcrypt.
+        checked with bcrypt, on HASH_POOL.
+        Raises:
+          - HashPoolSaturated: if the hashing pool is saturated.
         Returns:
           - True if all the credentials of the user is correct
           - False if the credentials are incorrect.
@@ -91,12 +167,15 @@ class Auth:
             return False
 
         try:
-            user = self._db.find_user_by(email=email)
+            with METRICS.time('auth_phase_duration_seconds', 'user_lookup'):
+                user = self._db.find_user_by(email=email)
         except NoResultFound:
             return False
 
-        if not checkpw(password.encode('utf-8'), user.hashed_password):
-            return False
+        with METRICS.time('auth_phase_duration_seconds', 'bcrypt'):
+            if not HASH_POOL.run(checkpw, password.encode('utf-8'),
+                                 user.hashed_password):
+                return False
 
         return True
 
@@ -104,7 +183,8 @@ class Auth:
         """Provides a session ID as a string.
 
         Finds an user with their email. Generates a uuid and stores it in the
-        database as the user's session id.
+        database as a new session of the user; the other sessions of the
+        user stay valid.
 
         Returns:
           - the generated session id for the user.
@@ -118,32 +198,86 @@ class Auth:
             return None
 
         session_id: str = _generate_uuid()
-        self._db.update_user(user.id, session_id=session_id)
+        expires_at = None
+        if self._session_duration > 0:
+            expires_at = datetime.utcnow() + \
+                timedelta(seconds=self._session_duration)
+        self._db.add_session(user.id, session_id, expires_at)
+        if not self._track_last_seen:
+            self._purge_expired()
+        self._session_cache.put(session_id, SessionUser(user.id, user.email),
+                                self._session_duration or None)
 
         return session_id
 
     def get_user_from_session_id(self, session_id: str) -> User:
         """Returns an user associated with the given session id.
 
+        The session cache is looked up first.
         Returns:
-          - the User corresponding to the session id.
+          - the User corresponding to the session id, or its cached
+          SessionUser record (with the same `id` and `email`).
           - otherwise None.
         """
         if not session_id:
             return None
 
+        if self._shared_session_cache:
+            self._session_cache.sync_generation(
+                self._db.get_session_generation())
+
+        cached_user = self._session_cache.get(session_id)
+        if cached_user is not None:
+            self._touch_session(session_id)
+            return cached_user
+
         try:
-            user: User = self._db.find_user_by(session_id=session_id)
+            with METRICS.time('auth_phase_duration_seconds',
+                              'session_lookup'):
+                user, expires_at = self._db.find_user_by_session(session_id)
         except NoResultFound:
             return None
 
+        self._touch_session(session_id)
+        # the session may expire before the cache entry would
+        ttl = None
+        if expires_at is not None:
+            ttl = (expires_at - datetime.utcnow()).total_seconds()
+        self._session_cache.put(session_id, SessionUser(user.id, user.email),
+                                ttl)
         return user
 
-    def destroy_session(self, user_id: str) -> None:
-        """Deletes a user's session_id.
+    def _purge_expired(self) -> None:
+        """Purges the expired sessions and reset tokens, at most once per
+        session duration, when no background thread does it.
+        """
+        if self._session_duration <= 0 and self._reset_token_ttl <= 0:
+            return
+        now = time.monotonic()
+        if now < self._next_purge:
+            return
+        self._next_purge = now + (self._session_duration or
+                                  self._reset_token_ttl)
+        if self._session_duration > 0:
+            self._db.purge_expired_sessions()
+        if self._reset_token_ttl > 0:
+            self._db.purge_expired_reset_tokens()
+
+    def _touch_session(self, session_id: str) -> None:
+        """Records that a session was just seen, saved by flush_sessions.
+
+        Nothing is recorded without the background thread.
+        """
+        if not self._track_last_seen:
+            return
+        with self._last_seen_lock:
+            self._last_seen[session_id] = datetime.utcnow()
+
+    def destroy_session(self, user_id: str, session_id: str = None) -> None:
+        """Deletes a session of a user, or all of them.
 
-        The session_id belonging to the user in the database is set to None
-        and saved.
+        Only the session `session_id` is deleted if given, every session of
+        the user otherwise.
 
         Fault:
           - no exception is raised for an incorrect argument or unsuccessful
@@ -152,19 +286,28 @@ class Auth:
         if not user_id:
             return None
 
-        try:
-            self._db.update_user(user_id, session_id=None)
-        except NoResultFound:
-            pass
+        self._db.delete_sessions(user_id, session_id)
+
+        if session_id is not None:
+            self._session_cache.invalidate(session_id)
+        else:
+            self._session_cache.invalidate_user(user_id)
+        if self._shared_session_cache:
+            self._db.bump_session_generation()
 
         return None
 
+    def session_cache_stats(self) -> dict:
+        """Returns the hit/miss counters of the session cache.
+        """
+        return self._session_cache.stats()
+
     def get_reset_password_token(self, email: str) -> str:
         """Provides a reset password token.
 
-        Finds the user with the given email.
-        If the user exists, it generates a UUID and updates the user’s
-        reset_token database field.
+        Generates a UUID and stores it, with its expiration date, in the
+        reset_token fields of the user with the given email, in a single
+        UPDATE statement.
 
         Exception:
           - ValueError: If the user does not exist.
@@ -174,35 +317,35 @@ class Auth:
         if not email:
             return None
 
-        try:
-            user = self._db.find_user_by(email=email)
-        except NoResultFound:
-            raise ValueError('The user does not exist')
-
         reset_pwd_token = _generate_uuid()
-        self._db.update_user(user.id, reset_token=reset_pwd_token)
+        expires_at = None
+        if self._reset_token_ttl > 0:
+            expires_at = datetime.utcnow() + \
+                timedelta(seconds=self._reset_token_ttl)
+        if not self._db.set_reset_token(email, reset_pwd_token, expires_at):
+            raise ValueError('The user does not exist')
 
         return reset_pwd_token
 
     def update_password(self, reset_token: str, password: str) -> None:
         """Updates the password of an user.
 
-        Should the reset token's association to the user be valid, then
-        the new password will be hashed and the reseet token will be set
-        to None. These changes will be made to the database.
+        The token is checked first with an indexed SELECT, so an unknown
+        or expired token is rejected without hashing. The new password is
+        then hashed, stored and the token cleared in a single conditional
+        UPDATE, which only matches a token that has not expired nor been
+        used already, even by a concurrent request.
 
         Exception:
           - ValueError: if invalid args ar provided or,
-          if the user does not exist.
+          if the token is unknown, expired or already used.
         """
         if not reset_token or not password:
             raise ValueError
 
-        try:
-            user = self._db.find_user_by(reset_token=reset_token)
-        except NoResultFound:
+        if not self._db.is_reset_token_valid(reset_token):
             raise ValueError
 
         hashed_password = _hash_password(password)
-        self._db.update_user(user.id, hashed_password=hashed_password,
-                             reset_token=None)
+        if not self._db.consume_reset_token(reset_token, hashed_password):
+            raise ValueError
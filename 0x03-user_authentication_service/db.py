@@ -1,30 +1,146 @@
 #!/usr/bin/env python3
 """DB module
 """
-from sqlalchemy import create_engine
+from datetime import datetime
+from os import getenv
+from typing import Dict, Tuple
+from sqlalchemy import bindparam, create_engine, event, inspect, literal, \
+    select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.engine.url import make_url
 from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy.orm.session import Session
-from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.exc import IntegrityError, InvalidRequestError
 from sqlalchemy.orm.exc import NoResultFound
 
-from user import Base, User
+from user import Base, SessionGeneration, User, UserSession
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    """Tunes every new SQLite connection of the pool.
+
+    WAL lets readers run alongside the writer, synchronous=NORMAL is safe
+    in WAL mode and avoids an fsync per commit, and mmap_size
+    (AUTH_DB_MMAP_SIZE bytes) lets reads go through memory-mapped I/O.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA mmap_size={:d}".format(
+        int(getenv("AUTH_DB_MMAP_SIZE", 256 * 1024 * 1024))))
+    cursor.close()
+
+
+def _migrate_schema(connection: Connection) -> None:
+    """Adds the columns and indexes of the models missing from the database.
+
+    `create_all` does not alter tables that already exist, so this migrates
+    databases created before the columns or indexes were declared. Only
+    nullable columns can be added this way, and creating a unique index
+    fails if the existing rows hold duplicates.
+
+    The sessions of the legacy user.session_id column are moved to the
+    user_session table, so their users stay logged in.
+    """
+    inspector = inspect(connection)
+    preparer = connection.dialect.identifier_preparer
+    for table in Base.metadata.sorted_tables:
+        existing = {column['name']
+                    for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=connection.dialect)
+                connection.execute(text("ALTER TABLE {} ADD COLUMN {} {}"
+                                        .format(preparer.format_table(table),
+                                                preparer.format_column(column),
+                                                column_type)))
+
+        existing = {index['name']
+                    for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(connection)
+
+    users, sessions = User.__table__, UserSession.__table__
+    now = datetime.utcnow()
+    legacy = select(users.c.session_id, users.c.id, literal(now),
+                    literal(now)) \
+        .where(users.c.session_id.is_not(None)) \
+        .where(users.c.session_id.not_in(select(sessions.c.session_id)))
+    connection.execute(sessions.insert().from_select(
+        ['session_id', 'user_id', 'created_at', 'last_seen'], legacy))
+    connection.execute(users.update().where(users.c.session_id.is_not(None))
+                       .values(session_id=None))
+
+
+def _valid_reset_token(reset_token: str):
+    """Filter matching a reset token that has not expired, which is
+    searched with the reset_token index.
+    """
+    return (User.reset_token == reset_token) & \
+        ((User.reset_token_expires_at == None) |  # noqa: E711
+         (User.reset_token_expires_at > datetime.utcnow()))
 
 
 class DB:
     """DB class
     """
 
-    def __init__(self) -> None:
+    def __init__(self, url: str = None, reset: bool = None) -> None:
         """Initialize a new DB instance
+
+        Configuration, from the arguments or else the environment:
+          - url (AUTH_DB_URL): database URL, `sqlite:///a.db` by default.
+          - reset (AUTH_DB_RESET): when true, all the tables are dropped
+          and created again. Otherwise (the default) only the missing
+          tables, columns and indexes are created and the existing data
+          is kept.
+          - AUTH_DB_POOL_SIZE, AUTH_DB_MAX_OVERFLOW: size of the connection
+          pool (5 and 10 by default). Connections are checked (pre-ping)
+          before being handed out.
         """
-        self._engine = create_engine(
-            "sqlite:///a.db",
-            connect_args={"check_same_thread": False},
-            echo=False)
-        Base.metadata.drop_all(self._engine)
+        if url is None:
+            url = getenv("AUTH_DB_URL", "sqlite:///a.db")
+        if reset is None:
+            reset = getenv("AUTH_DB_RESET", "0").lower() in \
+                ("1", "true", "yes")
+
+        db_url = make_url(url)
+        is_sqlite = db_url.get_backend_name() == "sqlite"
+        engine_args = {"echo": False, "pool_pre_ping": True}
+        if is_sqlite:
+            engine_args["connect_args"] = {"check_same_thread": False}
+        if not is_sqlite or db_url.database not in (None, "", ":memory:"):
+            # in-memory SQLite uses a single connection, not a pool
+            engine_args["pool_size"] = int(getenv("AUTH_DB_POOL_SIZE", 5))
+            engine_args["max_overflow"] = int(
+                getenv("AUTH_DB_MAX_OVERFLOW", 10))
+
+        self._engine = create_engine(db_url, **engine_args)
+        if is_sqlite:
+            event.listen(self._engine, "connect", _set_sqlite_pragmas)
+
+        if reset:
+            Base.metadata.drop_all(self._engine)
         Base.metadata.create_all(self._engine)
+        with self._engine.begin() as connection:
+            _migrate_schema(connection)
         self._session_factory = sessionmaker(bind=self._engine)
         self.__session = scoped_session(self._session_factory)
+        self._seed_session_generation()
+
+    def _seed_session_generation(self) -> None:
+        """Creates the row of the session generation counter if missing,
+        so that bump_session_generation only has to update it.
+
+        Another process starting at the same time may insert it first.
+        """
+        if self._session.get(SessionGeneration, 1) is None:
+            self._session.add(SessionGeneration(id=1, generation=0))
+        try:
+            self._session.commit()
+        except IntegrityError:
+            self._session.rollback()
 
     @property
     def _session(self) -> Session:
@@ -38,12 +154,19 @@ class DB:
     def add_user(self, email, hashed_password) -> User:
         """Saves a new user to the database.
         No validation is done.
+        Raises:
+          - IntegrityError: when a user already has this email (the unique
+          constraint is the only check). The session is rolled back.
         Returns:
           - The new user.
         """
         user: User = User(email=email, hashed_password=hashed_password)
         self._session.add(user)
-        self._session.commit()
+        try:
+            self._session.commit()
+        except IntegrityError:
+            self._session.rollback()
+            raise
 
         return user
 
@@ -77,22 +200,236 @@ class DB:
     def update_user(self, user_id: int, **kwargs) -> None:
         """Updates a user's attributes and saves it to the database.
 
-        Dependency:
-          - The user is found using DB's `find_user_by` method.
+        The update is a single `UPDATE ... WHERE id = ?` statement: the
+        user is not loaded first. A user already loaded in the session is
+        updated in place.
         Raises:
           - TypeError: when an invalid keyword argument is passed.
+          - NoResultFound: when no user has this id.
         Returns:
           - None
         """
-        try:
-            user: User = self.find_user_by(id=user_id)
-        except NoResultFound:
+        columns = User.__table__.columns.keys()
+        for key in kwargs.keys():
+            if key not in columns or key == 'id':
+                raise TypeError
+
+        if not kwargs:
+            self.find_user_by(id=user_id)
+            return None
+
+        updated = self._session.query(User).filter(User.id == user_id) \
+            .update(kwargs, synchronize_session='evaluate')
+        self._session.commit()
+
+        if updated == 0:
+            raise NoResultFound
+        return None
+
+    def update_users(self, updates: Dict[int, dict]) -> None:
+        """Updates the attributes of several users in one transaction.
+
+        `updates` maps user ids to the attributes to set. Users updated with
+        the same set of attributes share a single executemany statement.
+        Nothing is saved if one of the users does not exist.
+        Raises:
+          - TypeError: when an invalid attribute is passed.
+          - NoResultFound: when one of the user ids is not found.
+        Returns:
+          - None
+        """
+        table = User.__table__
+        batches = {}
+        for user_id, attributes in updates.items():
+            for key in attributes.keys():
+                if key not in table.columns or key == 'id':
+                    raise TypeError
+            if not attributes:
+                continue
+            keys = tuple(sorted(attributes.keys()))
+            params = {'b_' + key: attributes[key] for key in keys}
+            params['b_id'] = user_id
+            batches.setdefault(keys, []).append(params)
+
+        expected = 0
+        updated = 0
+        for keys, params in batches.items():
+            stmt = table.update() \
+                .where(table.c.id == bindparam('b_id')) \
+                .values({key: bindparam('b_' + key) for key in keys})
+            updated += self._session.execute(stmt, params).rowcount
+            expected += len(params)
+
+        if updated != expected:
+            self._session.rollback()
+            raise NoResultFound
+
+        self._session.commit()
+        # objects loaded in the session were updated behind its back
+        self._session.expire_all()
+        return None
+
+    def set_reset_token(self, email: str, reset_token: str,
+                        expires_at: datetime = None) -> bool:
+        """Gives a new reset token to the user of an email, in a single
+        UPDATE statement.
+        Returns:
+          - False if no user has this email.
+        """
+        updated = self._session.query(User).filter(User.email == email) \
+            .update({User.reset_token: reset_token,
+                     User.reset_token_expires_at: expires_at},
+                    synchronize_session='evaluate')
+        self._session.commit()
+
+        return updated > 0
+
+    def is_reset_token_valid(self, reset_token: str) -> bool:
+        """Checks, with an indexed SELECT, that a reset token exists and
+        has not expired.
+        """
+        user_id = self._session.query(User.id) \
+            .filter(_valid_reset_token(reset_token)).first()
+        # ends the read transaction, so the next call sees new commits
+        self._session.commit()
+
+        return user_id is not None
+
+    def consume_reset_token(self, reset_token: str,
+                            hashed_password: bytes) -> bool:
+        """Sets the password of the user of a reset token, and clears the
+        token, in a single conditional UPDATE statement.
+
+        The token only matches if it has not expired, and it can only be
+        consumed once, even by concurrent requests.
+        Returns:
+          - False if the token is unknown, expired or already consumed.
+        """
+        updated = self._session.query(User) \
+            .filter(_valid_reset_token(reset_token)) \
+            .update({User.hashed_password: hashed_password,
+                     User.reset_token: None,
+                     User.reset_token_expires_at: None},
+                    synchronize_session=False)
+        self._session.commit()
+        if updated:
+            # the user may be loaded in the session with the old values
+            self._session.expire_all()
+
+        return updated > 0
+
+    def purge_expired_reset_tokens(self) -> int:
+        """Clears the expired reset tokens, using the
+        reset_token_expires_at index.
+        Returns:
+          - the number of cleared tokens.
+        """
+        updated = self._session.query(User) \
+            .filter(User.reset_token_expires_at <= datetime.utcnow()) \
+            .update({User.reset_token: None,
+                     User.reset_token_expires_at: None},
+                    synchronize_session=False)
+        self._session.commit()
+
+        return updated
+
+    def add_session(self, user_id: int, session_id: str,
+                    expires_at: datetime = None) -> UserSession:
+        """Saves a new session of a user.
+        Returns:
+          - The new session.
+        """
+        now = datetime.utcnow()
+        user_session = UserSession(session_id=session_id, user_id=user_id,
+                                   created_at=now, last_seen=now,
+                                   expires_at=expires_at)
+        self._session.add(user_session)
+        self._session.commit()
+
+        return user_session
+
+    def find_user_by_session(self, session_id: str) -> Tuple[User, datetime]:
+        """Returns the user of a session that has not expired.
+
+        A single query joins the session (by primary key) to its user.
+        Raises:
+          - NoResultFound: when the session is not found or expired.
+        Returns:
+          - the user and the expiration date of the session (None if the
+          session never expires).
+        """
+        now = datetime.utcnow()
+        row = self._session.query(User, UserSession.expires_at) \
+            .join(UserSession, UserSession.user_id == User.id) \
+            .filter(UserSession.session_id == session_id) \
+            .filter((UserSession.expires_at == None) |  # noqa: E711
+                    (UserSession.expires_at > now)) \
+            .first()
+
+        if not row:
             raise NoResultFound
-        except InvalidRequestError:  # invalid argument passed
-            raise TypeError
 
-        for attr, value in kwargs.items():
-            setattr(user, attr, value)
+        return row[0], row[1]
+
+    def delete_sessions(self, user_id: int, session_id: str = None) -> int:
+        """Deletes one session of a user, or all of them.
+        Returns:
+          - the number of deleted sessions.
+        """
+        query = self._session.query(UserSession) \
+            .filter(UserSession.user_id == user_id)
+        if session_id is not None:
+            query = query.filter(UserSession.session_id == session_id)
+        deleted = query.delete(synchronize_session=False)
+        self._session.commit()
+
+        return deleted
+
+    def touch_sessions(self, last_seen: Dict[str, datetime]) -> None:
+        """Saves the last time several sessions were seen, in one
+        executemany statement.
+        """
+        if not last_seen:
+            return None
 
+        table = UserSession.__table__
+        stmt = table.update() \
+            .where(table.c.session_id == bindparam('b_session_id')) \
+            .values(last_seen=bindparam('b_last_seen'))
+        self._session.execute(stmt, [
+            {'b_session_id': session_id, 'b_last_seen': seen}
+            for session_id, seen in last_seen.items()])
         self._session.commit()
         return None
+
+    def purge_expired_sessions(self) -> int:
+        """Deletes the expired sessions, using the expires_at index.
+        Returns:
+          - the number of deleted sessions.
+        """
+        deleted = self._session.query(UserSession) \
+            .filter(UserSession.expires_at <= datetime.utcnow()) \
+            .delete(synchronize_session=False)
+        self._session.commit()
+
+        return deleted
+
+    def get_session_generation(self) -> int:
+        """Returns the shared session generation counter.
+        """
+        generation = self._session.query(SessionGeneration.generation) \
+            .filter(SessionGeneration.id == 1).scalar()
+        # ends the read transaction, so the next call sees new commits
+        self._session.commit()
+        return generation or 0
+
+    def bump_session_generation(self) -> None:
+        """Increments the shared session generation counter, whose row is
+        created by __init__.
+        """
+        self._session.query(SessionGeneration) \
+            .filter(SessionGeneration.id == 1) \
+            .update({SessionGeneration.generation:
+                     SessionGeneration.generation + 1},
+                    synchronize_session=False)
+        self._session.commit()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Bounded worker pool for the password hashing work.
+"""
+from concurrent.futures import Executor, ProcessPoolExecutor, \
+    ThreadPoolExecutor
+from os import cpu_count, getenv
+from threading import BoundedSemaphore, Lock
+from typing import Callable
+import asyncio
+import time
+
+
+class HashPoolSaturated(Exception):
+    """Raised when the hashing pool cannot take more work."""
+
+
+class HashPool:
+    """Runs CPU heavy hashing calls (bcrypt) on a bounded pool of workers.
+
+    At most `workers` calls run at once and `queue_size` more can wait for
+    a worker. Beyond that, calls fail right away with HashPoolSaturated
+    instead of piling up, so the app can answer 429.
+    bcrypt releases the GIL, so threads already spread the work across
+    cores; processes can be used instead with `kind='process'`.
+    """
+
+    def __init__(self, workers: int = None, queue_size: int = None,
+                 kind: str = None) -> None:
+        """Initializes the pool.
+
+        Configuration, from the arguments or else the environment:
+          - workers (AUTH_HASH_WORKERS): number of workers, the number of
+          CPUs by default.
+          - queue_size (AUTH_HASH_QUEUE_SIZE): number of calls allowed to
+          wait for a worker, 4 per worker by default.
+          - kind (AUTH_HASH_POOL): `thread` (default) or `process`.
+        """
+        if workers is None:
+            workers = int(getenv('AUTH_HASH_WORKERS', cpu_count() or 1))
+        if queue_size is None:
+            queue_size = int(getenv('AUTH_HASH_QUEUE_SIZE', workers * 4))
+        if kind is None:
+            kind = getenv('AUTH_HASH_POOL', 'thread')
+
+        self.workers = workers
+        self.queue_size = queue_size
+        self.kind = kind
+        self._executor: Executor = None
+        self._slots = BoundedSemaphore(workers + queue_size)
+        self._lock = Lock()
+        self._in_flight = 0
+        self._calls = 0
+        self._rejected = 0
+        self._total_latency = 0.0
+        self._max_latency = 0.0
+
+    def _get_executor(self) -> Executor:
+        """Returns the executor, created on first use.
+        """
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    if self.kind == 'process':
+                        self._executor = ProcessPoolExecutor(self.workers)
+                    else:
+                        self._executor = ThreadPoolExecutor(
+                            self.workers, thread_name_prefix='hash')
+        return self._executor
+
+    def _acquire(self) -> float:
+        """Takes a slot of the pool for a call.
+
+        Raises:
+          - HashPoolSaturated: when no slot is left.
+        Returns:
+          - the start time of the call.
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise HashPoolSaturated('Too many hashing requests')
+
+        with self._lock:
+            self._in_flight += 1
+        return time.perf_counter()
+
+    def _release(self, start: float) -> None:
+        """Gives back the slot of a call and records its latency.
+        """
+        latency = time.perf_counter() - start
+        with self._lock:
+            self._in_flight -= 1
+            self._calls += 1
+            self._total_latency += latency
+            self._max_latency = max(self._max_latency, latency)
+        self._slots.release()
+
+    def run(self, func: Callable, *args):
+        """Runs `func(*args)` on the pool and waits for its result.
+
+        Raises:
+          - HashPoolSaturated: when all the workers are busy and the queue
+          is full.
+        Returns:
+          - the result of the call.
+        """
+        start = self._acquire()
+        try:
+            return self._get_executor().submit(func, *args).result()
+        finally:
+            self._release(start)
+
+    async def run_async(self, func: Callable, *args):
+        """Runs `func(*args)` on the pool without blocking the event loop.
+
+        Raises:
+          - HashPoolSaturated: when all the workers are busy and the queue
+          is full.
+        Returns:
+          - the result of the call.
+        """
+        start = self._acquire()
+        try:
+            future = self._get_executor().submit(func, *args)
+            return await asyncio.wrap_future(future)
+        finally:
+            self._release(start)
+
+    def stats(self) -> dict:
+        """Returns the metrics of the pool.
+
+        `queue_depth` counts the calls waiting for a worker and `in_flight`
+        the calls either waiting or running. Latencies are in seconds and
+        include the time spent waiting.
+        """
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'queue_size': self.queue_size,
+                'in_flight': self._in_flight,
+                'queue_depth': max(0, self._in_flight - self.workers),
+                'calls': self._calls,
+                'rejected': self._rejected,
+                'avg_latency': (self._total_latency / self._calls
+                                if self._calls else 0.0),
+                'max_latency': self._max_latency,
+            }
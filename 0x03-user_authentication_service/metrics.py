@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Runtime metrics of the service, in the Prometheus text format.
+
+Observations are aggregated per thread, without any lock: each thread
+updates its own series, and the series are only merged when the metrics
+are rendered. The series of a finished thread are folded into a shared
+set of series, so short-lived request threads do not pile up.
+"""
+from bisect import bisect_left
+from threading import Lock, local
+from typing import Callable, Iterable
+import time
+import weakref
+
+
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram():
+    """Definition of a histogram: name, help text, labels and buckets.
+    """
+
+    def __init__(self, name: str, documentation: str,
+                 label_names: tuple, buckets: tuple = DEFAULT_BUCKETS):
+        """Initialize a histogram definition.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+
+
+class _Shard():
+    """Series of one thread: {(name, label values): [bucket counts...,
+    +Inf count, sum]}.
+    """
+    __slots__ = ('series', '__weakref__')
+
+    def __init__(self):
+        """Initialize an empty shard.
+        """
+        self.series = {}
+
+
+class Timer():
+    """Context manager observing the time spent in its block.
+    """
+    __slots__ = ('_metrics', '_name', '_labels', '_start')
+
+    def __init__(self, metrics: 'Metrics', name: str, labels: tuple):
+        """Initialize a timer of the series (name, labels).
+        """
+        self._metrics = metrics
+        self._name = name
+        self._labels = labels
+
+    def __enter__(self) -> 'Timer':
+        """Start the timer.
+        """
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        """Observe the time spent since the start.
+        """
+        self._metrics.observe(self._name, self._labels,
+                              time.perf_counter() - self._start)
+
+
+class Metrics():
+    """Registry of histograms and of collectors of other metrics.
+    """
+
+    def __init__(self):
+        """Initialize an empty registry.
+        """
+        self._histograms = {}
+        self._collectors = []
+        self._local = local()
+        self._lock = Lock()
+        self._shards = {}
+        self._retired = {}
+
+    def histogram(self, name: str, documentation: str,
+                  label_names: tuple = (),
+                  buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        """Declare a histogram.
+        """
+        histogram = Histogram(name, documentation, label_names, buckets)
+        self._histograms[name] = histogram
+        return histogram
+
+    def add_collector(self, collector: Callable[[], Iterable[tuple]]):
+        """Add a function called on render, returning
+        (name, type, help, {label values tuple: value}, label names) tuples.
+        """
+        self._collectors.append(collector)
+
+    def _shard(self) -> dict:
+        """Series of the current thread, created on its first observation.
+        """
+        shard = _Shard()
+        token = id(shard)
+        with self._lock:
+            self._shards[token] = shard.series
+        weakref.finalize(shard, self._retire, token)
+        self._local.shard = shard
+        return shard.series
+
+    def _retire(self, token: int):
+        """Fold the series of a finished thread into the retired series.
+        """
+        with self._lock:
+            series = self._shards.pop(token, None)
+            if series is not None:
+                self._merge(self._retired, series)
+
+    @staticmethod
+    def _merge(into: dict, series: dict):
+        """Add the values of `series` to `into`.
+        """
+        for key, values in series.items():
+            total = into.get(key)
+            if total is None:
+                into[key] = list(values)
+            else:
+                for i, value in enumerate(values):
+                    total[i] += value
+
+    def observe(self, name: str, labels: tuple, value: float):
+        """Record an observation of the histogram `name`.
+        """
+        shard = getattr(self._local, 'shard', None)
+        series = shard.series if shard is not None else self._shard()
+        values = series.get((name, labels))
+        histogram = self._histograms[name]
+        if values is None:
+            values = series[(name, labels)] = \
+                [0] * (len(histogram.buckets) + 1) + [0.0]
+        values[bisect_left(histogram.buckets, value)] += 1
+        values[-1] += value
+
+    def time(self, name: str, *labels: str) -> Timer:
+        """Context manager observing the time spent in its block.
+        """
+        return Timer(self, name, labels)
+
+    def collect(self) -> dict:
+        """Merge the series of all the threads.
+        """
+        merged = {}
+        with self._lock:
+            self._merge(merged, self._retired)
+            for series in self._shards.values():
+                # the owner thread may add a series meanwhile
+                self._merge(merged, dict(series))
+        return merged
+
+    def render(self) -> str:
+        """Render all the metrics in the Prometheus text format.
+        """
+        lines = []
+        merged = self.collect()
+        by_name = {}
+        for (name, labels), values in merged.items():
+            by_name.setdefault(name, []).append((labels, values))
+
+        for name, histogram in self._histograms.items():
+            lines.append("# HELP {} {}".format(name, histogram.documentation))
+            lines.append("# TYPE {} histogram".format(name))
+            for labels, values in sorted(by_name.get(name, ())):
+                label_str = _format_labels(histogram.label_names, labels)
+                cumulated = 0
+                for bound, count in zip(histogram.buckets, values):
+                    cumulated += count
+                    lines.append("{}_bucket{{{}le=\"{}\"}} {}".format(
+                        name, label_str, bound, cumulated))
+                cumulated += values[-2]
+                lines.append("{}_bucket{{{}le=\"+Inf\"}} {}".format(
+                    name, label_str, cumulated))
+                label_str = _braces(label_str)
+                lines.append("{}_sum{} {}".format(name, label_str,
+                                                  values[-1]))
+                lines.append("{}_count{} {}".format(name, label_str,
+                                                    cumulated))
+
+        for collector in self._collectors:
+            for name, kind, documentation, samples, label_names \
+                    in collector():
+                lines.append("# HELP {} {}".format(name, documentation))
+                lines.append("# TYPE {} {}".format(name, kind))
+                for labels, value in samples.items():
+                    label_str = _format_labels(label_names, labels)
+                    lines.append("{}{} {}".format(name, _braces(label_str),
+                                                  value))
+
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(label_names: tuple, labels: tuple) -> str:
+    """Format label pairs, each followed by a comma.
+    """
+    return "".join('{}="{}",'.format(name, str(value).replace('\\', '\\\\')
+                                     .replace('"', '\\"')
+                                     .replace('\n', '\\n'))
+                   for name, value in zip(label_names, labels))
+
+
+def _braces(label_str: str) -> str:
+    """Wrap formatted labels in braces, nothing if there is no label.
+    """
+    return "{{{}}}".format(label_str.rstrip(',')) if label_str else ""
+
+
+METRICS = Metrics()
+METRICS.histogram('http_request_duration_seconds',
+                  "Duration of the HTTP requests",
+                  ('method', 'route', 'status'))
+METRICS.histogram('auth_phase_duration_seconds',
+                  "Duration of the phases of the authentication",
+                  ('phase',))
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Opt-in sampling profiler of the requests.
+
+A background thread samples the stacks of the threads serving profiled
+requests and aggregates them in the collapsed format of flamegraph.pl
+(`frame;frame;frame count` lines). A request is profiled if it is drawn
+at PROFILE_SAMPLE_RATE, or once it has been running for PROFILE_SLOW_MS.
+
+Configuration:
+  - PROFILE_SAMPLE_RATE: fraction of the requests profiled (default: 0)
+  - PROFILE_SLOW_MS: profile the requests running for longer than this
+  many milliseconds (default: 0, disabled)
+  - PROFILE_INTERVAL_MS: time between two samples (default: 5)
+  - PROFILE_OUTPUT: file written with the collapsed stacks, `{pid}` is
+  replaced by the process id (default: `profile.{pid}.folded`)
+  - PROFILE_FLUSH_INTERVAL: seconds between two writes (default: 10)
+
+When neither PROFILE_SAMPLE_RATE nor PROFILE_SLOW_MS is set, the WSGI app
+is left untouched.
+"""
+from collections import Counter
+from os import getenv
+from threading import Lock, Thread, get_ident
+from typing import Callable
+from werkzeug.wsgi import ClosingIterator
+import atexit
+import os
+import random
+import sys
+import time
+
+
+def _collapse(frame) -> str:
+    """Collapsed stack of a frame, from the outermost call.
+    """
+    names = []
+    while frame is not None:
+        names.append("{}:{}".format(frame.f_globals.get('__name__', '?'),
+                                    frame.f_code.co_name))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler():
+    """WSGI middleware sampling the stacks of the profiled requests.
+    """
+
+    def __init__(self, wsgi_app: Callable, sample_rate: float = 0,
+                 slow_ms: float = 0, interval_ms: float = 5,
+                 output: str = 'profile.{pid}.folded',
+                 flush_interval: float = 10):
+        """Initialize the middleware and start its sampling thread.
+        """
+        self.wsgi_app = wsgi_app
+        self.sample_rate = sample_rate
+        self.slow = slow_ms / 1000 if slow_ms > 0 else None
+        self.interval = interval_ms / 1000
+        self.output = output.format(pid=os.getpid())
+        self.flush_interval = flush_interval
+        # thread id -> (start time, drawn for sampling)
+        self._active = {}
+        self._stacks = Counter()
+        self._lock = Lock()
+        Thread(target=self._sample_loop, daemon=True).start()
+        atexit.register(self.flush)
+
+    def __call__(self, environ: dict, start_response: Callable):
+        """Serve a request, registered as profiled or not.
+
+        The request stays profiled until its response is closed, so the
+        streamed bodies are sampled too.
+        """
+        thread_id = get_ident()
+        drawn = self.sample_rate > 0 and random.random() < self.sample_rate
+        self._active[thread_id] = (time.perf_counter(), drawn)
+
+        def done():
+            self._active.pop(thread_id, None)
+
+        try:
+            response = self.wsgi_app(environ, start_response)
+        except BaseException:
+            done()
+            raise
+        return ClosingIterator(response, done)
+
+    def sample(self):
+        """Take one sample of the stacks of the profiled requests.
+        """
+        if not self._active:
+            return
+        now = time.perf_counter()
+        frames = sys._current_frames()
+        stacks = []
+        for thread_id, (start, drawn) in list(self._active.items()):
+            if not drawn and (self.slow is None or now - start < self.slow):
+                continue
+            frame = frames.get(thread_id)
+            if frame is not None:
+                stacks.append(_collapse(frame))
+        if stacks:
+            with self._lock:
+                self._stacks.update(stacks)
+
+    def _sample_loop(self):
+        """Sample every `interval` seconds, flush every `flush_interval`.
+        """
+        last_flush = time.monotonic()
+        while True:
+            time.sleep(self.interval)
+            self.sample()
+            if time.monotonic() - last_flush >= self.flush_interval:
+                self.flush()
+                last_flush = time.monotonic()
+
+    def flush(self):
+        """Write all the samples taken so far to the output file.
+        """
+        with self._lock:
+            if not self._stacks:
+                return
+            lines = ["{} {}\n".format(stack, count)
+                     for stack, count in self._stacks.most_common()]
+        tmp_path = self.output + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.writelines(lines)
+        os.replace(tmp_path, self.output)
+
+
+def profiler_middleware(wsgi_app: Callable) -> Callable:
+    """Wrap a WSGI app in a SamplingProfiler, if enabled by PROFILE_*.
+    """
+    sample_rate = float(getenv('PROFILE_SAMPLE_RATE', 0))
+    slow_ms = float(getenv('PROFILE_SLOW_MS', 0))
+    if sample_rate <= 0 and slow_ms <= 0:
+        return wsgi_app
+
+    return SamplingProfiler(
+        wsgi_app, sample_rate, slow_ms,
+        float(getenv('PROFILE_INTERVAL_MS', 5)),
+        getenv('PROFILE_OUTPUT', 'profile.{pid}.folded'),
+        float(getenv('PROFILE_FLUSH_INTERVAL', 10)))
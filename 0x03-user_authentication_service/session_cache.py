@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+In-process cache of the users of the sessions.
+"""
+from collections import OrderedDict, namedtuple
+from threading import Lock
+import time
+
+
+# lightweight record of a session's user, instead of an ORM User
+SessionUser = namedtuple('SessionUser', ['id', 'email'])
+
+
+class SessionCache:
+    """Bounded LRU cache, with a TTL, mapping session ids to SessionUser.
+
+    Entries are invalidated per session or per user (write-through from
+    destroy_session). The cache can also follow a generation number
+    shared by several processes: when it changes, some other process
+    destroyed a session and the whole cache is dropped.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 30) -> None:
+        """Initializes the cache.
+
+        Args:
+            max_size(int): maximum number of entries, 0 disables the cache.
+            ttl(float): lifetime of an entry in seconds.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.generation = None
+        self._entries = OrderedDict()
+        self._sessions_by_user = {}
+        self._lock = Lock()
+
+    def get(self, session_id: str) -> SessionUser:
+        """Returns the user cached for a session id.
+
+        Returns:
+          - None, if the session is not cached or its entry expired.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    self._drop(session_id)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(session_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, session_id: str, user: SessionUser,
+            ttl: float = None) -> None:
+        """Caches the user of a session id.
+
+        `ttl` can shorten the lifetime of the entry, e.g. for a session
+        expiring soon. The least recently used entry is dropped when the
+        cache is full.
+        """
+        if self.max_size <= 0:
+            return
+        if ttl is None or ttl > self.ttl:
+            ttl = self.ttl
+        expires_at = time.monotonic() + ttl
+        with self._lock:
+            self._drop(session_id)
+            self._entries[session_id] = (expires_at, user)
+            self._sessions_by_user.setdefault(user.id, set()).add(
+                session_id)
+            while len(self._entries) > self.max_size:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, session_id: str) -> None:
+        """Drops the cached entry of a session.
+        """
+        with self._lock:
+            self._drop(session_id)
+
+    def invalidate_user(self, user_id: int) -> None:
+        """Drops the cached sessions of a user.
+        """
+        with self._lock:
+            for session_id in list(self._sessions_by_user.get(user_id, ())):
+                self._drop(session_id)
+
+    def sync_generation(self, generation: int) -> None:
+        """Drops every entry if the shared generation number changed.
+        """
+        with self._lock:
+            if generation != self.generation:
+                self._entries.clear()
+                self._sessions_by_user.clear()
+                self.generation = generation
+
+    def _drop(self, session_id: str) -> None:
+        """Drops an entry. The lock must be held.
+        """
+        entry = self._entries.pop(session_id, None)
+        if entry is None:
+            return
+        sessions = self._sessions_by_user.get(entry[1].id)
+        if sessions is not None:
+            sessions.discard(session_id)
+            if not sessions:
+                del self._sessions_by_user[entry[1].id]
+
+    def stats(self) -> dict:
+        """Returns the counters of the cache.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
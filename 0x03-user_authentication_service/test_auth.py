@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Concurrent registrations: when several threads register the same emails
+at once, exactly one registration of each email succeeds and the database
+holds no duplicated email.
+
+Run from this directory with:
+    python3 -m unittest test_auth
+"""
+from bcrypt import gensalt
+from sqlalchemy import text
+from threading import Barrier, Thread
+from unittest import mock
+import os
+import tempfile
+import unittest
+
+from auth import Auth
+from hash_pool import HashPool
+
+
+class TestConcurrentRegistrations(unittest.TestCase):
+    """register_user from several threads on a shared SQLite file.
+    """
+    threads = 8
+    emails = ['user{}@example.com'.format(i) for i in range(25)]
+
+    def setUp(self) -> None:
+        """Creates an Auth on a new database file, hashing with a low
+        bcrypt cost on a pool large enough for all the threads.
+        """
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        environ = {
+            'AUTH_DB_URL': 'sqlite:///{}'.format(
+                os.path.join(tmp_dir.name, 'a.db')),
+            'AUTH_DB_RESET': '1',
+            'AUTH_SESSION_FLUSH_INTERVAL': '0',
+        }
+        for patcher in (mock.patch.dict(os.environ, environ),
+                        mock.patch('auth.gensalt', lambda: gensalt(4)),
+                        mock.patch('auth.HASH_POOL',
+                                   HashPool(2, self.threads))):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.auth = Auth()
+        self.addCleanup(self.auth._db._engine.dispose)
+
+    def test_same_emails_from_several_threads(self) -> None:
+        """Every thread registers every email; one registration of each
+        email succeeds, the others raise ValueError.
+        """
+        created = {email: 0 for email in self.emails}
+        rejected = {email: 0 for email in self.emails}
+        errors = []
+        barrier = Barrier(self.threads)
+
+        def register(i: int) -> None:
+            # half of the threads go through the emails backwards
+            emails = self.emails[::-1] if i % 2 else self.emails
+            barrier.wait()
+            for email in emails:
+                try:
+                    self.auth.register_user(email, 'pwd')
+                    created[email] += 1
+                except ValueError:
+                    rejected[email] += 1
+                except Exception as error:
+                    errors.append(error)
+
+        workers = [Thread(target=register, args=(i,))
+                   for i in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(created, {email: 1 for email in self.emails})
+        self.assertEqual(rejected, {email: self.threads - 1
+                                    for email in self.emails})
+
+        session = self.auth._db._session
+        duplicated = session.execute(text(
+            'SELECT email, COUNT(*) FROM user GROUP BY email '
+            'HAVING COUNT(*) > 1')).all()
+        self.assertEqual(duplicated, [])
+        count = session.execute(text('SELECT COUNT(*) FROM user')).scalar()
+        self.assertEqual(count, len(self.emails))
+
+
+if __name__ == '__main__':
+    unittest.main()
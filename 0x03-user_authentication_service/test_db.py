@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Query plans of the DB lookups: every lookup by email, session id or reset
+token must search an index, never scan a table.
+
+Run from this directory with:
+    python3 -m unittest test_db
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import event
+import unittest
+
+from db import DB
+
+
+class TestQueryPlans(unittest.TestCase):
+    """EXPLAIN QUERY PLAN of the statements run by the DB methods.
+    """
+
+    def setUp(self) -> None:
+        """Creates an in-memory database with a user, a session and a reset
+        token, and records the statements run from then on.
+        """
+        self.db = DB('sqlite://', reset=True)
+        user = self.db.add_user('bob@example.com', b'hashed')
+        self.db.add_session(user.id, 'session-1', None)
+        self.db.set_reset_token('bob@example.com', 'token-1',
+                                datetime.utcnow() + timedelta(hours=1))
+        self.statements = []
+        event.listen(self.db._engine, 'before_cursor_execute',
+                     self._record)
+
+    def tearDown(self) -> None:
+        """Closes the connections.
+        """
+        self.db._engine.dispose()
+
+    def _record(self, connection, cursor, statement, parameters, context,
+                executemany) -> None:
+        """Keeps the statements reading or writing rows.
+        """
+        if statement.lstrip().startswith(('SELECT', 'UPDATE', 'DELETE')):
+            self.statements.append((statement, parameters))
+
+    def plan(self, call) -> list:
+        """Runs `call` and returns the query plan of its statements.
+        """
+        self.statements.clear()
+        call()
+        self.assertTrue(self.statements)
+        plan = []
+        with self.db._engine.connect() as connection:
+            for statement, parameters in self.statements:
+                rows = connection.exec_driver_sql(
+                    'EXPLAIN QUERY PLAN ' + statement, parameters)
+                plan.extend(row[-1] for row in rows)
+        return plan
+
+    def assertSearches(self, plan: list, table: str, index: str) -> None:
+        """Checks that a plan searches `table` with `index` and scans
+        nothing.
+        """
+        self.assertIn('SEARCH {} USING INDEX {} '.format(table, index),
+                      '\n'.join(plan) + ' ')
+        for step in plan:
+            self.assertFalse(step.startswith('SCAN'), plan)
+
+    def test_find_user_by_email(self) -> None:
+        """find_user_by(email=...) searches the email index.
+        """
+        plan = self.plan(
+            lambda: self.db.find_user_by(email='bob@example.com'))
+        self.assertSearches(plan, 'user', 'ix_user_email')
+
+    def test_find_user_by_session(self) -> None:
+        """The session lookup searches the primary key index of
+        user_session, then the user by id.
+        """
+        plan = self.plan(lambda: self.db.find_user_by_session('session-1'))
+        self.assertSearches(plan, 'user_session',
+                            'sqlite_autoindex_user_session_1')
+        self.assertIn('SEARCH user USING INTEGER PRIMARY KEY (rowid=?)',
+                      plan)
+
+    def test_find_user_by_reset_token(self) -> None:
+        """find_user_by(reset_token=...) searches the reset_token index.
+        """
+        plan = self.plan(lambda: self.db.find_user_by(reset_token='token-1'))
+        self.assertSearches(plan, 'user', 'ix_user_reset_token')
+
+    def test_is_reset_token_valid(self) -> None:
+        """The reset token check done before hashing searches the
+        reset_token index.
+        """
+        plan = self.plan(lambda: self.db.is_reset_token_valid('token-1'))
+        self.assertSearches(plan, 'user', 'ix_user_reset_token')
+
+    def test_consume_reset_token(self) -> None:
+        """The UPDATE consuming a reset token searches the reset_token
+        index.
+        """
+        plan = self.plan(
+            lambda: self.db.consume_reset_token('token-1', b'new'))
+        self.assertSearches(plan, 'user', 'ix_user_reset_token')
+
+    def test_purge_expired_reset_tokens(self) -> None:
+        """The purge searches the reset_token_expires_at index.
+        """
+        plan = self.plan(self.db.purge_expired_reset_tokens)
+        self.assertSearches(plan, 'user', 'ix_user_reset_token_expires_at')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,17 +3,53 @@
 User model for end-users.
 """
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, String
 
 Base = declarative_base()
 
 
 class User(Base):
-    """Representation of an end-user."""
+    """Representation of an end-user.
+
+    The columns used to look users up are indexed: email and session_id
+    are unique, reset_token is not.
+    A reset token is valid until reset_token_expires_at (forever if None).
+    Sessions are stored in the user_session table; the session_id column
+    is only kept for the databases created before it, and its sessions are
+    moved to user_session on startup.
+    """
     __tablename__ = 'user'
 
     id = Column(Integer, primary_key=True)
-    email = Column(String(250), nullable=False)
+    email = Column(String(250), nullable=False, unique=True, index=True)
     hashed_password = Column(String(250), nullable=False)
-    session_id = Column(String(70), nullable=True)
-    reset_token = Column(String(70), nullable=True)
+    session_id = Column(String(70), nullable=True, unique=True, index=True)
+    reset_token = Column(String(70), nullable=True, index=True)
+    reset_token_expires_at = Column(DateTime, nullable=True, index=True)
+
+
+class UserSession(Base):
+    """A session of a user. A user can have several sessions at once.
+
+    expires_at is None for sessions that never expire.
+    """
+    __tablename__ = 'user_session'
+
+    session_id = Column(String(70), primary_key=True)
+    user_id = Column(Integer, ForeignKey('user.id', ondelete='CASCADE'),
+                     nullable=False, index=True)
+    created_at = Column(DateTime, nullable=False)
+    last_seen = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=True, index=True)
+
+
+class SessionGeneration(Base):
+    """Counter bumped whenever a session is destroyed.
+
+    Processes caching sessions compare it with the value they cached
+    with, to notice changes made by other processes.
+    """
+    __tablename__ = 'session_generation'
+
+    id = Column(Integer, primary_key=True)
+    generation = Column(Integer, nullable=False, default=0)
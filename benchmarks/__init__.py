@@ -0,0 +1,7 @@
+#!/usr/bin/env python3
+"""
+Benchmarks of the auth hot paths of the three projects.
+
+Run them all, from the root of the repository, with:
+    python3 -m benchmarks
+"""
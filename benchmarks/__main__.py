@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Runs the benchmark suites against the projects and writes their results,
+with the environment they ran in, as one JSON document.
+
+Every suite runs in its own process, with the directory of the project
+on the path and a scratch working directory, as the projects keep their
+data in files of the working directory.
+"""
+from datetime import datetime, timezone
+import argparse
+import importlib.metadata
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (suite, project directory, extra environment)
+RUNS = [
+    ('models', '0x02-Session_authentication', {}),
+    ('auth', '0x01-Basic_authentication', {}),
+    ('auth', '0x02-Session_authentication', {}),
+    ('api', '0x01-Basic_authentication', {'AUTH_TYPE': 'basic_auth'}),
+    ('api', '0x02-Session_authentication', {'AUTH_TYPE': 'basic_auth'}),
+    ('api', '0x02-Session_authentication', {'AUTH_TYPE': 'session_auth'}),
+    ('service', '0x03-user_authentication_service', {}),
+]
+
+PACKAGES = ['flask', 'sqlalchemy', 'bcrypt', 'quart', 'aiosqlite']
+
+QUICK_SIZES = '100,1000'
+
+
+def git_commit() -> str:
+    """Returns the commit of the repository, None outside of git.
+    """
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True,
+            text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment(args: argparse.Namespace) -> dict:
+    """Describes the machine, the interpreter and the packages.
+    """
+    versions = {}
+    for name in PACKAGES:
+        try:
+            versions[name] = importlib.metadata.version(name)
+        except importlib.metadata.PackageNotFoundError:
+            versions[name] = None
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'git_commit': git_commit(),
+        'packages': versions,
+        'options': {'sizes': args.sizes, 'min_time': args.min_time,
+                    'bcrypt_rounds': args.bcrypt_rounds},
+    }
+
+
+def run_suite(suite: str, project: str, env: dict,
+              args: argparse.Namespace) -> list:
+    """Runs a suite against a project.
+
+    Returns:
+      - the results of the suite, tagged with the project.
+    """
+    print("== {} on {} {}".format(suite, project, env or ''),
+          file=sys.stderr, flush=True)
+    process_env = dict(os.environ, **env)
+    process_env['PYTHONPATH'] = os.pathsep.join(
+        [ROOT, os.path.join(ROOT, project)])
+    command = [sys.executable, '-m', 'benchmarks.bench_' + suite,
+               '--sizes', args.sizes, '--min-time', str(args.min_time),
+               '--bcrypt-rounds', str(args.bcrypt_rounds)]
+    with tempfile.TemporaryDirectory(prefix='bench_') as cwd:
+        process = subprocess.run(command, cwd=cwd, env=process_env,
+                                 stdout=subprocess.PIPE, text=True)
+
+    results = []
+    for line in process.stdout.splitlines():
+        if line.startswith('{'):
+            result = json.loads(line)
+            result['project'] = project
+            results.append(result)
+    if process.returncode:
+        results.append({'suite': suite, 'project': project,
+                        'name': 'error', 'params': env,
+                        'returncode': process.returncode})
+    return results
+
+
+def main() -> None:
+    """Runs the suites.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--suite', action='append',
+                        choices=sorted({run[0] for run in RUNS}),
+                        help="suite to run, all by default (repeatable)")
+    parser.add_argument('--sizes', default='1000,10000,100000',
+                        help="comma separated dataset sizes")
+    parser.add_argument('--quick', action='store_true',
+                        help="small sizes ({}) and short measures"
+                        .format(QUICK_SIZES))
+    parser.add_argument('--min-time', type=float, default=0.5,
+                        help="minimum time spent per measure, in seconds")
+    parser.add_argument('--bcrypt-rounds', type=int, default=4,
+                        help="bcrypt cost used where hashing is not the "
+                        "measured operation")
+    parser.add_argument('--output', default='-',
+                        help="file of the results, stdout by default")
+    args = parser.parse_args()
+    if args.quick:
+        args.sizes = QUICK_SIZES
+        args.min_time = min(args.min_time, 0.1)
+
+    results = []
+    for suite, project, env in RUNS:
+        if args.suite and suite not in args.suite:
+            continue
+        results.extend(run_suite(suite, project, env, args))
+
+    document = json.dumps({'environment': environment(args),
+                           'results': results}, indent=2)
+    if args.output == '-':
+        print(document)
+    else:
+        with open(args.output, 'w') as file:
+            file.write(document + '\n')
+    if any(result['name'] == 'error' for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+End-to-end throughput of the routes of the APIs, through the Flask test
+client.
+
+Runs against the directory of 0x01 or 0x02, with the authentication of
+AUTH_TYPE (`basic_auth` by default, `session_auth` in 0x02).
+"""
+from benchmarks.bench_models import make_users, reset_storage
+from benchmarks.common import emit, measure, parse_args, progress
+from itertools import count
+import base64
+import json
+import os
+
+os.environ.setdefault('AUTH_TYPE', 'basic_auth')
+os.environ.setdefault('SESSION_NAME', '_my_session_id')
+
+from models.user import User  # noqa: E402
+
+
+SUITE = 'api'
+
+
+def bench_size(app, size: int, min_time: float) -> None:
+    """Measures every route with `size` users.
+    """
+    auth_type = os.environ['AUTH_TYPE']
+    params = {'size': size, 'auth_type': auth_type}
+    reset_storage()
+    users = make_users(size)
+    User.save_many(users)
+    user = users[size // 2]
+    client = app.test_client()
+
+    headers = {}
+    if auth_type == 'basic_auth':
+        credentials = '{}:password{}'.format(user.email, size // 2)
+        headers['Authorization'] = 'Basic ' + base64.b64encode(
+            credentials.encode()).decode()
+    else:
+        response = client.post('/api/v1/auth_session/login', data={
+            'email': user.email, 'password': 'password{}'.format(size // 2)})
+        if response.status_code != 200:
+            raise RuntimeError("login failed: {}".format(response.status))
+
+    def route(name: str, method: str, path: str, max_calls: int = 1000000,
+              **kwargs) -> None:
+        func = getattr(client, method.lower())
+        status = func(path, headers=headers, **kwargs).status_code
+        # get_data consumes the streamed responses
+        stats = measure(lambda: func(path, headers=headers,
+                                     **kwargs).get_data(),
+                        min_time, max_calls)
+        emit(SUITE, name, dict(params, method=method, path=path,
+                               status=status), **stats)
+
+    route('status', 'GET', '/api/v1/status')
+    route('stats', 'GET', '/api/v1/stats')
+    route('metrics', 'GET', '/api/v1/metrics')
+    route('users_page', 'GET', '/api/v1/users?limit=100')
+    route('user', 'GET', '/api/v1/users/{}'.format(user.id))
+    route('users_export', 'GET', '/api/v1/users/export', max_calls=20)
+    route('user_update', 'PUT', '/api/v1/users/{}'.format(user.id),
+          max_calls=200, json={'first_name': 'Bob'})
+
+    emails = ('bench{}@example.com'.format(i) for i in count())
+    stats = measure(lambda: client.post(
+        '/api/v1/users', headers=headers,
+        json={'email': next(emails), 'password': 'pwd'}), min_time, 200)
+    emit(SUITE, 'user_create', dict(params, method='POST',
+                                    path='/api/v1/users'), **stats)
+
+    batch = 100
+
+    def import_users():
+        body = "\n".join(json.dumps({'email': next(emails), 'password': 'pwd'})
+                         for _ in range(batch))
+        client.post('/api/v1/users/import', headers=headers, data=body,
+                    content_type='application/x-ndjson')
+
+    stats = measure(import_users, min_time, 200)
+    emit(SUITE, 'users_import', dict(params, method='POST', batch=batch,
+                                     path='/api/v1/users/import'),
+         users_per_sec=stats['ops_per_sec'] * batch, **stats)
+
+    if auth_type != 'basic_auth':
+        route('me', 'GET', '/api/v1/users/me')
+
+
+def main(argv: list = None) -> None:
+    """Runs the suite.
+    """
+    args = parse_args(__doc__, argv)
+    # the views load the users on import
+    reset_storage()
+    from api.v1.app import app
+    for size in args.sizes:
+        progress("api ({}): {} users".format(os.environ['AUTH_TYPE'], size))
+        bench_size(app, size, args.min_time)
+    reset_storage()
+
+
+if __name__ == "__main__":
+    main()
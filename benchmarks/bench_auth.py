@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Benchmarks of the authentication of the APIs (api.v1.auth).
+
+Runs against the directory of 0x01 or 0x02. The session suites only run
+where api.v1.auth.session_auth exists (0x02).
+"""
+from benchmarks.bench_models import make_users, reset_storage
+from benchmarks.common import emit, measure, parse_args, progress
+from flask import Flask
+from itertools import cycle
+from werkzeug.test import EnvironBuilder
+import base64
+import importlib.util
+import os
+import time
+import tracemalloc
+
+from api.v1.auth.auth import Auth, ExcludedPaths
+from api.v1.auth.basic_auth import BasicAuth
+from models.user import User
+
+
+SUITE = 'auth'
+
+EXCLUDED_PATHS = ['/api/v1/status/', '/api/v1/unauthorized/',
+                  '/api/v1/forbidden/', '/api/v1/auth_session/login/',
+                  '/api/v1/stat*']
+
+
+def basic_request_context(email: str, pwd: str):
+    """Builds a request context with Basic credentials.
+
+    Auth.authorization_header reads the headers of the current Flask
+    request, so the context must be pushed around the calls.
+    """
+    credentials = base64.b64encode('{}:{}'.format(email, pwd).encode())
+    return Flask(__name__).test_request_context('/api/v1/users/me', headers={
+        'Authorization': 'Basic ' + credentials.decode()})
+
+
+def cookie_request(session_id: str):
+    """Builds a request with a session cookie.
+    """
+    return EnvironBuilder(path='/api/v1/users/me', headers={
+        'Cookie': '{}={}'.format(os.environ['SESSION_NAME'], session_id)}) \
+        .get_request()
+
+
+def bench_paths(min_time: float) -> None:
+    """Measures require_auth and the excluded paths matcher.
+    """
+    auth = Auth()
+    excluded = ExcludedPaths(EXCLUDED_PATHS)
+    paths = cycle(['/api/v1/status', '/api/v1/users/1234',
+                   '/api/v1/stats/', '/api/v1/forbidden']).__next__
+    emit(SUITE, 'excluded_paths_match', {},
+         **measure(lambda: excluded.match(paths()), min_time))
+    emit(SUITE, 'require_auth_list', {},
+         **measure(lambda: auth.require_auth(paths(), EXCLUDED_PATHS),
+                   min_time))
+    emit(SUITE, 'require_auth_compiled', {},
+         **measure(lambda: auth.require_auth(paths(), excluded), min_time))
+
+
+def bench_passwords(min_time: float) -> None:
+    """Measures the password verification with every hasher.
+    """
+    from models.hashers import HASHERS
+    for name, hasher in sorted(HASHERS.items()):
+        encoded = hasher.encode('password')
+        emit(SUITE, 'password_verify', {'hasher': name},
+             **measure(lambda: hasher.verify('password', encoded),
+                       min_time, max_calls=100000))
+
+
+def bench_basic_auth(size: int, min_time: float) -> None:
+    """Measures BasicAuth.current_user with `size` users, with and without
+    the credential cache.
+    """
+    params = {'size': size}
+    reset_storage()
+    users = make_users(size)
+    User.save_many(users)
+    i = size // 2
+    valid = basic_request_context(users[i].email, 'password{}'.format(i))
+    wrong = basic_request_context(users[i].email, 'wrong')
+
+    for cache_size in (0, 1024):
+        os.environ['BASIC_AUTH_CACHE_SIZE'] = str(cache_size)
+        auth = BasicAuth()
+        name = 'basic_current_user_cached' if cache_size else \
+            'basic_current_user'
+        with valid as context:
+            emit(SUITE, name, params,
+                 **measure(lambda: auth.current_user(context.request),
+                           min_time))
+        if cache_size:
+            emit(SUITE, 'credential_cache', params,
+                 **auth.credential_cache.stats())
+    with wrong as context:
+        emit(SUITE, 'basic_current_user_wrong_password', params,
+             **measure(lambda: auth.current_user(context.request),
+                       min_time))
+    os.environ.pop('BASIC_AUTH_CACHE_SIZE')
+
+
+def bench_sessions(size: int, min_time: float) -> None:
+    """Measures the creation and the lookup of sessions, with every
+    session auth class.
+    """
+    from api.v1.auth.session_auth import SessionAuth
+    from api.v1.auth.session_db_auth import SessionDBAuth
+    from api.v1.auth.session_exp_auth import SessionExpAuth
+
+    reset_storage()
+    users = make_users(size)
+    User.save_many(users)
+    os.environ.setdefault('SESSION_NAME', '_my_session_id')
+    os.environ['SESSION_DURATION'] = '3600'
+
+    for auth_class in (SessionAuth, SessionExpAuth, SessionDBAuth):
+        for cache_size in ((0, 10000) if auth_class is SessionDBAuth
+                           else (None,)):
+            if cache_size is not None:
+                os.environ['SESSION_DB_CACHE_SIZE'] = str(cache_size)
+            SessionAuth.user_id_by_session_id.clear()
+            auth = auth_class()
+            name = auth_class.__name__
+            if cache_size:
+                name += '_cached'
+            params = {'size': size, 'class': name}
+            next_user_id = cycle(user.id for user in users).__next__
+            emit(SUITE, 'create_session', params,
+                 **measure(lambda: auth.create_session(next_user_id()),
+                           min_time, max_calls=size))
+
+            requests = [cookie_request(auth.create_session(user.id))
+                        for user in users[:100]]
+            next_request = cycle(requests).__next__
+            emit(SUITE, 'session_current_user', params,
+                 **measure(lambda: auth.current_user(next_request()),
+                           min_time))
+
+            def churn():
+                session_id = auth.create_session(next_user_id())
+                request = cookie_request(session_id)
+                auth.current_user(request)
+                auth.destroy_session(request)
+
+            emit(SUITE, 'session_churn', params,
+                 **measure(churn, min_time))
+    for name in ('SESSION_DURATION', 'SESSION_DB_CACHE_SIZE'):
+        os.environ.pop(name, None)
+    for file_path in ('.db_UserSession.sqlite', '.db_UserSession.sqlite-wal',
+                      '.db_UserSession.sqlite-shm'):
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+
+def bench_session_churn(duration: int = 1, rounds: int = 4,
+                        interval: float = 0.25) -> None:
+    """Logs in continuously, without logging out, for `rounds` session
+    durations of `duration` seconds, and samples the size of the session
+    storage, of the expiry heap and of the traced memory over time.
+
+    With SessionExpAuth the storage levels off at the sessions of the last
+    `duration` seconds; SessionAuth, which never expires, is the baseline.
+    """
+    from api.v1.auth.session_auth import SessionAuth
+    from api.v1.auth.session_exp_auth import SessionExpAuth
+
+    os.environ['SESSION_DURATION'] = str(duration)
+    storage = SessionAuth.user_id_by_session_id
+    heap = SessionExpAuth.session_expiry_heap
+    for auth_class in (SessionAuth, SessionExpAuth):
+        storage.clear()
+        heap.clear()
+        auth = auth_class()
+        next_user_id = cycle('user{}'.format(i) for i in range(1000)).__next__
+        samples = []
+        logins = 0
+        tracemalloc.start()
+        start = time.perf_counter()
+        next_sample = start
+        while True:
+            now = time.perf_counter()
+            if now >= next_sample:
+                samples.append({
+                    'elapsed': round(now - start, 3), 'logins': logins,
+                    'storage_size': len(storage), 'heap_size': len(heap),
+                    'memory_bytes': tracemalloc.get_traced_memory()[0]})
+                next_sample += interval
+                if now - start >= duration * rounds:
+                    break
+            auth.create_session(next_user_id())
+            logins += 1
+        tracemalloc.stop()
+
+        # the last session duration is the steady state
+        steady = [sample for sample in samples
+                  if sample['elapsed'] >= duration * (rounds - 1)]
+        emit(SUITE, 'session_churn_memory',
+             {'class': auth_class.__name__, 'session_duration': duration},
+             logins=logins,
+             logins_per_sec=logins / samples[-1]['elapsed'],
+             steady_max_storage_size=max(
+                 sample['storage_size'] for sample in steady),
+             steady_max_memory_bytes=max(
+                 sample['memory_bytes'] for sample in steady),
+             final_storage_size=len(storage), final_heap_size=len(heap),
+             samples=samples)
+    storage.clear()
+    heap.clear()
+    os.environ.pop('SESSION_DURATION')
+
+
+def main(argv: list = None) -> None:
+    """Runs the suite.
+    """
+    args = parse_args(__doc__, argv)
+    progress("auth: paths and passwords")
+    bench_paths(args.min_time)
+    bench_passwords(args.min_time)
+    has_sessions = importlib.util.find_spec(
+        'api.v1.auth.session_auth') is not None
+    if has_sessions:
+        progress("auth: session churn")
+        bench_session_churn()
+    for size in args.sizes:
+        progress("auth: {} users".format(size))
+        bench_basic_auth(size, args.min_time)
+        if has_sessions:
+            bench_sessions(size, args.min_time)
+    reset_storage()
+
+
+if __name__ == "__main__":
+    main()
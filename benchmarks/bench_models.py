@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Benchmarks of the file-backed models (models.base and models.user).
+
+Runs against the directory of 0x01 or 0x02, which share their models.
+"""
+from benchmarks.common import emit, measure, parse_args, progress
+from itertools import cycle
+import glob
+import os
+import tracemalloc
+
+from models import base
+from models.user import User
+
+
+SUITE = 'models'
+
+
+def reset_storage() -> None:
+    """Drops every object from memory and the files of the working
+    directory.
+    """
+    for registry in (base.DATA, base.INDEXES, base.ORDERED_IDS,
+                     base.JOURNAL_SIZES, base.PENDING):
+        registry.clear()
+    for file_path in glob.glob('.db_*'):
+        os.remove(file_path)
+
+
+def make_users(size: int) -> list:
+    """Builds `size` users, not saved.
+    """
+    users = []
+    for i in range(size):
+        user = User(email='user{}@example.com'.format(i),
+                    first_name='First{}'.format(i % 100),
+                    last_name='Last{}'.format(i))
+        user.password = 'password{}'.format(i)
+        users.append(user)
+    return users
+
+
+def bench_size(size: int, min_time: float) -> None:
+    """Measures the storage operations with `size` users.
+    """
+    params = {'size': size}
+    reset_storage()
+    os.environ.pop('DATA_JOURNAL', None)
+    os.environ.pop('DATA_LAZY_LOAD', None)
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    users = make_users(size)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    emit(SUITE, 'memory_per_user', params,
+         bytes_per_user=(after - before) / size)
+
+    stats = measure(lambda: User.save_many(users), min_time, max_calls=1)
+    emit(SUITE, 'save_many', params, users_per_sec=size * stats[
+        'ops_per_sec'], **stats)
+
+    step = max(1, size // 1000)
+    next_email = cycle('user{}@example.com'.format(i)
+                       for i in range(0, size, step)).__next__
+    next_id = cycle(user.id for user in users[::step]).__next__
+    last_name = 'Last{}'.format(size - 1)
+    after = None
+
+    def page():
+        nonlocal after
+        users_page = User.page(after, 100)
+        after = users_page[-1].id if users_page else None
+
+    emit(SUITE, 'search_indexed', params,
+         **measure(lambda: User.search({'email': next_email()}), min_time))
+    emit(SUITE, 'search_scan', params,
+         **measure(lambda: User.search({'last_name': last_name}), min_time))
+    emit(SUITE, 'get', params,
+         **measure(lambda: User.get(next_id()), min_time))
+    emit(SUITE, 'page_100', params, **measure(page, min_time))
+
+    next_credentials = cycle((users[i], 'password{}'.format(i))
+                             for i in range(0, size, step)).__next__
+
+    def verify():
+        user, pwd = next_credentials()
+        user.is_valid_password(pwd)
+
+    emit(SUITE, 'password_verify_sha256', params,
+         **measure(verify, min_time))
+
+    user = users[0]
+    emit(SUITE, 'save_snapshot', params,
+         **measure(user.save, min_time, max_calls=200))
+    os.environ['DATA_JOURNAL'] = '1'
+    os.environ.setdefault('DATA_JOURNAL_COMPACT_EVERY', str(10 ** 9))
+    emit(SUITE, 'save_journal', params, **measure(user.save, min_time))
+    User.compact()
+    os.environ.pop('DATA_JOURNAL')
+
+    del users, user
+    for lazy in (False, True):
+        if lazy:
+            os.environ['DATA_LAZY_LOAD'] = '1'
+        stats = measure(User.load_from_file, min_time, max_calls=5)
+        # memory held once loaded, measured apart as tracing slows the load
+        base.DATA.clear()
+        base.PENDING.clear()
+        tracemalloc.start()
+        User.load_from_file()
+        loaded, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        emit(SUITE, 'load_lazy' if lazy else 'load', params,
+             loaded_bytes_per_user=loaded / size,
+             peak_bytes_per_user=peak / size, **stats)
+        os.environ.pop('DATA_LAZY_LOAD', None)
+
+    reset_storage()
+
+
+def main(argv: list = None) -> None:
+    """Runs the suite.
+    """
+    args = parse_args(__doc__, argv)
+    for size in args.sizes:
+        progress("models: {} users".format(size))
+        bench_size(size, args.min_time)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+"""
+Benchmarks of the user authentication service (0x03): the database,
+the sessions, the hashing pool, concurrent sign-ups and the routes of
+the Flask app and of the Quart app.
+
+Runs against the directory of 0x03. bcrypt runs with --bcrypt-rounds,
+except for the verify rate, measured at the default cost as well.
+"""
+from benchmarks.common import emit, measure, parse_args, progress
+from itertools import count, cycle
+from threading import Barrier, Thread, local as local_data
+import asyncio
+import importlib.util
+import os
+import time
+
+os.environ['AUTH_SESSION_FLUSH_INTERVAL'] = '0'
+# every size starts from an empty database
+os.environ['AUTH_DB_RESET'] = '1'
+# the apps create their own Auth on import, which resets its database
+os.environ['AUTH_DB_URL'] = 'sqlite://'
+# the sign-up stress must measure the service, not the backpressure
+os.environ.setdefault('AUTH_HASH_QUEUE_SIZE', '4096')
+
+import app as flask_app  # noqa: E402
+import bcrypt  # noqa: E402
+import auth  # noqa: E402
+from auth import Auth, HASH_POOL  # noqa: E402
+from session_cache import SessionCache  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+from sqlalchemy.exc import IntegrityError  # noqa: E402
+from sqlalchemy.orm.exc import NoResultFound  # noqa: E402
+from user import User  # noqa: E402
+
+
+SUITE = 'service'
+
+PASSWORD = 'password'
+
+
+def use_bcrypt_rounds(rounds: int) -> None:
+    """Makes the service hash the new passwords with `rounds`.
+    """
+    def gensalt() -> bytes:
+        return bcrypt.gensalt(rounds)
+
+    auth.gensalt = gensalt
+    if importlib.util.find_spec('async_auth') is not None:
+        import async_auth
+        async_auth.gensalt = gensalt
+
+
+def new_auth(size: int, hashed_password: bytes) -> Auth:
+    """Returns an Auth on a new database of `size` users, all with the
+    password PASSWORD.
+    """
+    os.environ['AUTH_DB_URL'] = 'sqlite:///bench_{}.db'.format(size)
+    service = Auth()
+    session = service._db._session
+    session.add_all(User(email='user{}@example.com'.format(i),
+                         hashed_password=hashed_password)
+                    for i in range(size))
+    session.commit()
+    return service
+
+
+def run_threads(threads: int, func, duration: float,
+                on_exit=None) -> int:
+    """Calls `func` in a loop from `threads` threads for `duration`
+    seconds, then `on_exit` from each thread.
+
+    Returns:
+      - the total number of calls.
+    """
+    counts = [0] * threads
+    barrier = Barrier(threads + 1)
+
+    def worker(i: int) -> None:
+        barrier.wait()
+        deadline = time.perf_counter() + duration
+        calls = 0
+        while time.perf_counter() < deadline:
+            func()
+            calls += 1
+        counts[i] = calls
+        if on_exit is not None:
+            on_exit()
+
+    workers = [Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    for thread in workers:
+        thread.join()
+    return sum(counts)
+
+
+def bench_db(service: Auth, size: int, min_time: float) -> None:
+    """Measures the DB methods with `size` users.
+    """
+    params = {'size': size}
+    db = service._db
+    hashed_password = db.find_user_by(id=1).hashed_password
+    next_email = cycle('user{}@example.com'.format(i)
+                       for i in range(0, size, max(1, size // 1000))).__next__
+    next_id = cycle(range(1, size + 1, max(1, size // 1000))).__next__
+    new_emails = ('new{}@example.com'.format(i) for i in count())
+
+    emit(SUITE, 'db_add_user', params,
+         **measure(lambda: db.add_user(next(new_emails), hashed_password),
+                   min_time, max_calls=1000))
+    emit(SUITE, 'db_find_user_by_email', params,
+         **measure(lambda: db.find_user_by(email=next_email()), min_time))
+    emit(SUITE, 'db_find_user_by_id', params,
+         **measure(lambda: db.find_user_by(id=next_id()), min_time))
+    emit(SUITE, 'db_update_user', params,
+         **measure(lambda: db.update_user(next_id(), reset_token=None),
+                   min_time, max_calls=1000))
+
+    batch = 100
+    stats = measure(lambda: db.update_users(
+        {next_id(): {'reset_token': None} for _ in range(batch)}),
+        min_time, max_calls=200)
+    emit(SUITE, 'db_update_users', dict(params, batch=batch),
+         users_per_sec=stats['ops_per_sec'] * batch, **stats)
+
+    for threads in (1, 4, 8):
+        # the threads give back the connection of their scoped session
+        calls = run_threads(threads,
+                            lambda: db.find_user_by(email=next_email()),
+                            min_time, db._session.remove)
+        emit(SUITE, 'db_find_user_by_email_threads',
+             dict(params, threads=threads), calls=calls,
+             ops_per_sec=calls / min_time)
+
+
+def bench_sessions(service: Auth, size: int, min_time: float) -> None:
+    """Measures the sessions, with and without the session cache.
+    """
+    params = {'size': size}
+    next_email = cycle('user{}@example.com'.format(i)
+                       for i in range(0, size, max(1, size // 100))).__next__
+    emit(SUITE, 'create_session', params,
+         **measure(lambda: service.create_session(next_email()), min_time,
+                   max_calls=1000))
+
+    session_ids = cycle([service.create_session(next_email())
+                         for _ in range(100)]).__next__
+    emit(SUITE, 'get_user_from_session_id_cached', params,
+         **measure(lambda: service.get_user_from_session_id(session_ids()),
+                   min_time))
+    emit(SUITE, 'session_cache', params, **service.session_cache_stats())
+    cache, service._session_cache = service._session_cache, \
+        SessionCache(0, 0)
+    emit(SUITE, 'get_user_from_session_id', params,
+         **measure(lambda: service.get_user_from_session_id(session_ids()),
+                   min_time))
+    service._session_cache = cache
+    emit(SUITE, 'flush_sessions', params,
+         **measure(service.flush_sessions, min_time, max_calls=100))
+
+
+def bench_hash_pool(rounds: int, min_time: float) -> None:
+    """Measures the bcrypt verify rate of HASH_POOL, from one thread and
+    from as many threads as the pool has workers.
+    """
+    for cost in sorted({rounds, 12}):
+        hashed = bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(cost))
+        params = {'rounds': cost, 'workers': HASH_POOL.workers}
+
+        def verify():
+            HASH_POOL.run(bcrypt.checkpw, PASSWORD.encode(), hashed)
+
+        emit(SUITE, 'hash_pool_verify', params,
+             **measure(verify, min_time, max_calls=10000))
+        calls = run_threads(HASH_POOL.workers, verify, max(min_time, 1.0))
+        emit(SUITE, 'hash_pool_verify_threads',
+             dict(params, threads=HASH_POOL.workers), calls=calls,
+             ops_per_sec=calls / max(min_time, 1.0))
+
+
+def register_find_then_insert(service: Auth, email: str,
+                              password: str) -> None:
+    """The former registration path: the email is looked up, then the
+    password hashed and the user inserted.
+
+    Raises:
+      - ValueError: if the lookup finds the email.
+      - IntegrityError: if a concurrent registration of the email was
+      inserted between the lookup and the insert.
+    """
+    try:
+        service._db.find_user_by(email=email)
+    except NoResultFound:
+        service._db.add_user(email, auth._hash_password(password))
+        return
+    raise ValueError("User {} already exists".format(email))
+
+
+def bench_signups(service: Auth, size: int, threads: int = 8,
+                  per_thread: int = 50) -> None:
+    """Registers the same emails from `threads` threads at once, each
+    email twice, with register_user (insert first) and with the former
+    find-then-insert path, and counts the duplicated emails of the
+    database.
+    """
+    paths = [('insert_first', service.register_user),
+             ('find_then_insert',
+              lambda email, pwd: register_find_then_insert(service, email,
+                                                           pwd))]
+    for path, register in paths:
+        emails = ['{}{}@example.com'.format(path, i)
+                  for i in range(threads * per_thread // 2)]
+        created = [0] * threads
+        rejected = [0] * threads
+        races = [0] * threads
+        barrier = Barrier(threads + 1)
+
+        def worker(i: int) -> None:
+            # each slice of the emails is registered by a pair of threads,
+            # in opposite orders
+            mine = emails[i // 2::threads // 2]
+            if i % 2:
+                mine = mine[::-1]
+            barrier.wait()
+            for email in mine:
+                try:
+                    register(email, PASSWORD)
+                    created[i] += 1
+                except ValueError:
+                    rejected[i] += 1
+                except IntegrityError:
+                    races[i] += 1
+            service._db._session.remove()
+
+        workers = [Thread(target=worker, args=(i,)) for i in range(threads)]
+        for thread in workers:
+            thread.start()
+        barrier.wait()
+        start = time.perf_counter()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        duplicated = service._db._session.execute(text(
+            'SELECT email FROM user GROUP BY email HAVING COUNT(*) > 1')) \
+            .all()
+        service._db._session.commit()
+        attempts = sum(created) + sum(rejected) + sum(races)
+        emit(SUITE, 'concurrent_signups',
+             {'size': size, 'threads': threads, 'path': path},
+             attempts=attempts, created=sum(created),
+             rejected=sum(rejected), races=sum(races),
+             duplicated_emails=len(duplicated),
+             consistent=sum(created) == len(emails) and not duplicated,
+             registrations_per_sec=sum(created) / elapsed,
+             attempts_per_sec=attempts / elapsed)
+
+
+def bench_flask(service: Auth, size: int, min_time: float) -> None:
+    """Measures the routes of the Flask app, sequentially and from
+    several threads.
+    """
+    flask_app.AUTH = service
+    params = {'size': size, 'app': 'flask'}
+    email = 'user{}@example.com'.format(size // 2)
+    client = flask_app.app.test_client()
+    client.post('/sessions', data={'email': email, 'password': PASSWORD})
+    session_id = client.get_cookie('session_id').value
+    new_emails = ('flask{}@example.com'.format(i) for i in count())
+
+    def route(name: str, method: str, path: str, max_calls: int = 1000000,
+              **kwargs) -> None:
+        func = getattr(client, method.lower())
+        status = func(path, **kwargs).status_code
+        stats = measure(lambda: func(path, **kwargs).get_data(), min_time,
+                        max_calls)
+        emit(SUITE, name, dict(params, method=method, path=path,
+                               status=status), **stats)
+
+    route('route_index', 'GET', '/')
+    route('route_profile', 'GET', '/profile')
+    route('route_metrics', 'GET', '/metrics')
+    route('route_login', 'POST', '/sessions', max_calls=1000,
+          data={'email': email, 'password': PASSWORD})
+    route('route_reset_password', 'POST', '/reset_password', max_calls=1000,
+          data={'email': email})
+    stats = measure(lambda: client.post('/users', data={
+        'email': next(new_emails), 'password': PASSWORD}).get_data(),
+        min_time, max_calls=1000)
+    emit(SUITE, 'route_register', dict(params, method='POST', path='/users'),
+         **stats)
+
+    local = local_data()
+
+    def profile() -> None:
+        # a client per thread, the test client is not thread safe
+        if not hasattr(local, 'client'):
+            local.client = flask_app.app.test_client()
+            local.client.set_cookie('session_id', session_id)
+        local.client.get('/profile').get_data()
+
+    for threads in (1, 8):
+        calls = run_threads(threads, profile, min_time,
+                            service._db._session.remove)
+        emit(SUITE, 'route_profile_threads', dict(params, threads=threads),
+             calls=calls, ops_per_sec=calls / min_time)
+
+
+async def measure_async(coroutine_function, min_time: float,
+                        max_calls: int = 1000000) -> dict:
+    """Awaits `coroutine_function()` repeatedly, like measure does with
+    a function.
+    """
+    latencies = []
+    total = 0.0
+    while total < min_time and len(latencies) < max_calls:
+        start = time.perf_counter()
+        await coroutine_function()
+        latency = time.perf_counter() - start
+        latencies.append(latency)
+        total += latency
+
+    latencies.sort()
+    calls = len(latencies)
+    return {
+        'calls': calls,
+        'ops_per_sec': calls / total,
+        'mean_us': total / calls * 1e6,
+        'p50_us': latencies[calls // 2] * 1e6,
+        'p99_us': latencies[min(calls - 1, int(calls * 0.99))] * 1e6,
+        'max_us': latencies[-1] * 1e6,
+    }
+
+
+async def bench_quart(size: int, min_time: float) -> None:
+    """Measures the routes of the Quart app, on the database of the Flask
+    app, sequentially and from concurrent tasks.
+    """
+    import async_app
+    from async_auth import AsyncAuth
+    service = async_app.AUTH = AsyncAuth()
+    await service._db.init(reset=False)
+    params = {'size': size, 'app': 'quart'}
+    email = 'user{}@example.com'.format(size // 2)
+    client = async_app.app.test_client()
+    await client.post('/sessions', form={'email': email,
+                                         'password': PASSWORD})
+    new_emails = ('quart{}@example.com'.format(i) for i in count())
+
+    async def route(name: str, method: str, path: str,
+                    max_calls: int = 1000000, **kwargs) -> None:
+        func = getattr(client, method.lower())
+        status = (await func(path, **kwargs)).status_code
+
+        async def call():
+            await (await func(path, **kwargs)).get_data()
+
+        stats = await measure_async(call, min_time, max_calls)
+        emit(SUITE, name, dict(params, method=method, path=path,
+                               status=status), **stats)
+
+    await route('route_index', 'GET', '/')
+    await route('route_profile', 'GET', '/profile')
+    await route('route_metrics', 'GET', '/metrics')
+    await route('route_login', 'POST', '/sessions', max_calls=1000,
+                form={'email': email, 'password': PASSWORD})
+    await route('route_reset_password', 'POST', '/reset_password',
+                max_calls=1000, form={'email': email})
+
+    async def register():
+        await (await client.post('/users', form={
+            'email': next(new_emails), 'password': PASSWORD})).get_data()
+
+    stats = await measure_async(register, min_time, max_calls=1000)
+    emit(SUITE, 'route_register', dict(params, method='POST', path='/users'),
+         **stats)
+
+    for tasks in (1, 8):
+        counts = [0] * tasks
+
+        async def profile(i: int, deadline: float) -> None:
+            while time.perf_counter() < deadline:
+                await (await client.get('/profile')).get_data()
+                counts[i] += 1
+
+        deadline = time.perf_counter() + min_time
+        await asyncio.gather(*(profile(i, deadline) for i in range(tasks)))
+        emit(SUITE, 'route_profile_tasks', dict(params, tasks=tasks),
+             calls=sum(counts), ops_per_sec=sum(counts) / min_time)
+    await service._db.close()
+
+
+def main(argv: list = None) -> None:
+    """Runs the suite.
+    """
+    args = parse_args(__doc__, argv)
+    use_bcrypt_rounds(args.bcrypt_rounds)
+    hashed_password = bcrypt.hashpw(PASSWORD.encode(),
+                                    bcrypt.gensalt(args.bcrypt_rounds))
+    has_quart = all(importlib.util.find_spec(name) is not None
+                    for name in ('quart', 'aiosqlite'))
+
+    progress("service: hashing pool")
+    bench_hash_pool(args.bcrypt_rounds, args.min_time)
+    for size in args.sizes:
+        progress("service: {} users".format(size))
+        service = new_auth(size, hashed_password)
+        bench_db(service, size, args.min_time)
+        bench_sessions(service, size, args.min_time)
+        bench_signups(service, size)
+        bench_flask(service, size, args.min_time)
+        if has_quart:
+            asyncio.run(bench_quart(size, args.min_time))
+        else:
+            emit(SUITE, 'quart', {'size': size}, skipped="quart or "
+                 "aiosqlite is not installed")
+        service._db._engine.dispose()
+        for suffix in ('', '-wal', '-shm'):
+            file_path = 'bench_{}.db{}'.format(size, suffix)
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+
+if __name__ == "__main__":
+    main()
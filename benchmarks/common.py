@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Helpers shared by the benchmark suites.
+
+A suite is a module run in its own process, with the directory of the
+project it measures on the path and a scratch directory as working
+directory. It prints one JSON object per result on stdout.
+"""
+from typing import Callable
+import argparse
+import json
+import sys
+import time
+
+
+def parse_args(description: str, argv: list = None) -> argparse.Namespace:
+    """Parses the options common to all the suites.
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--sizes', default='1000,10000,100000',
+                        help="comma separated dataset sizes")
+    parser.add_argument('--min-time', type=float, default=0.5,
+                        help="minimum time spent per measure, in seconds")
+    parser.add_argument('--bcrypt-rounds', type=int, default=4,
+                        help="bcrypt cost used where hashing is not the "
+                        "measured operation")
+    args = parser.parse_args(argv)
+    args.sizes = [int(size) for size in args.sizes.split(',') if size]
+    return args
+
+
+def measure(func: Callable, min_time: float = 0.5,
+            max_calls: int = 1000000) -> dict:
+    """Calls `func` repeatedly and times every call.
+
+    Calls go on until `min_time` seconds are spent (at least one call),
+    or `max_calls` calls are made.
+    Returns:
+      - the number of calls, the operations per second and the mean, p50,
+      p99 and max latencies in microseconds.
+    """
+    latencies = []
+    perf_counter = time.perf_counter
+    total = 0.0
+    while total < min_time and len(latencies) < max_calls:
+        start = perf_counter()
+        func()
+        latency = perf_counter() - start
+        latencies.append(latency)
+        total += latency
+
+    latencies.sort()
+    calls = len(latencies)
+    return {
+        'calls': calls,
+        'ops_per_sec': calls / total if total else None,
+        'mean_us': total / calls * 1e6,
+        'p50_us': latencies[calls // 2] * 1e6,
+        'p99_us': latencies[min(calls - 1, int(calls * 0.99))] * 1e6,
+        'max_us': latencies[-1] * 1e6,
+    }
+
+
+def emit(suite: str, name: str, params: dict = None, **values) -> None:
+    """Prints a result as a JSON line.
+    """
+    record = {'suite': suite, 'name': name, 'params': params or {}}
+    record.update(values)
+    print(json.dumps(record), flush=True)
+
+
+def progress(message: str) -> None:
+    """Prints a progress message on stderr.
+    """
+    print(message, file=sys.stderr, flush=True)